@@ -6,6 +6,7 @@ import { SafeAreaView } from "react-native-safe-area-context";
 import { Ionicons } from "@expo/vector-icons";
 
 import { usePoseStore } from "../hooks/use-pose-store";
+import { decodePackedFrame } from "../backend/pose/poseEngine";
 import { PoseSkiaOverlay } from "../components/pose/PoseSkiaOverlay";
 import { useTheme } from "../hooks/use-theme";
 
@@ -48,7 +49,13 @@ export default function LiveWorkoutScreen() {
 
   const cameraRef = useRef(null);
   const frameTimerRef = useRef(null);
+  // Frames are sent without waiting for the previous response; numbering
+  // them lets the pose store drop responses that arrive out of order
+  const frameSeqRef = useRef(0);
   const stoppedRef = useRef(false);
+  // Keeps this workout on its own pose tracker on the server
+  const sessionIdRef = useRef(`${patientId}-${Date.now()}`);
+  const keypointSchemaRef = useRef(null);
 
   const [facing, setFacing] = useState("front");
   const [currentSet, setCurrentSet] = useState(1);
@@ -141,6 +148,16 @@ export default function LiveWorkoutScreen() {
     return () => clearInterval(id);
   }, [running]);
 
+  // Name table for packed keypoint responses; JSON frames until it loads
+  useEffect(() => {
+    fetch(`${API_BASE}/keypoint_schema`)
+      .then((res) => res.json())
+      .then((schema) => {
+        keypointSchemaRef.current = schema;
+      })
+      .catch(() => {});
+  }, []);
+
   const captureFrame = async () => {
     if (!cameraRef.current || !running || stoppedRef.current) return;
     try {
@@ -151,22 +168,35 @@ export default function LiveWorkoutScreen() {
         mute: true,
       });
 
+      const schema = keypointSchemaRef.current;
+      const seq = ++frameSeqRef.current;
       const res = await fetch(`${API_BASE}/analyze_frame`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          Accept: schema ? "application/octet-stream" : "application/json",
+        },
         body: JSON.stringify({
           image_base64: photo.base64,
           exercise_key: exerciseKey,
+          session_id: sessionIdRef.current,
+          patient_id: patientId,
         }),
       });
 
-      const data = await res.json();
-      const keypoints = data.pose?.keypoints || [];
+      let data;
+      if (res.headers.get("content-type")?.includes("application/octet-stream")) {
+        data = decodePackedFrame(await res.arrayBuffer(), schema, exerciseKey);
+      } else {
+        const json = await res.json();
+        data = { keypoints: json.pose?.keypoints || [], reps: json.reps };
+      }
+      const keypoints = data?.keypoints || [];
 
       if (keypoints.length > 0) {
         lastPoseTsRef.current = Date.now();
         setMotionUI(true);
-        processFrame({ keypoints });
+        processFrame({ keypoints, reps: data.reps }, seq);
 
         if (lastFormScoreRef.current != null) {
           totalFormScoreRef.current += lastFormScoreRef.current;
@@ -199,6 +229,9 @@ export default function LiveWorkoutScreen() {
       clearInterval(frameTimerRef.current);
       frameTimerRef.current = null;
     }
+    fetch(`${API_BASE}/analyze_frame/${encodeURIComponent(sessionIdRef.current)}`, {
+      method: "DELETE",
+    }).catch(() => {});
   };
 
   const endWorkout = () => {
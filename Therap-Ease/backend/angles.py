@@ -0,0 +1,31 @@
+import numpy as np
+
+from .landmarks import LANDMARK_INDEX, X, Y, VISIBILITY
+
+
+def triplet_indices(joints):
+    return np.array(
+        [[LANDMARK_INDEX[name] for name in triplet] for triplet in joints],
+        dtype=np.intp,
+    ).reshape(-1, 3)
+
+
+# landmarks: (..., 33, 4), e.g. one frame (33, 4) or a whole video (T, 33, 4)
+# triplets:  (J, 3) landmark indices (a, vertex, c)
+# returns:   (..., J) angles in degrees at each vertex, 0..180
+def joint_angles(landmarks, triplets):
+    points = landmarks[..., :, [X, Y]]
+    a = points[..., triplets[:, 0], :]
+    b = points[..., triplets[:, 1], :]
+    c = points[..., triplets[:, 2], :]
+
+    ab = a - b
+    cb = c - b
+    radians = np.arctan2(cb[..., 1], cb[..., 0]) - np.arctan2(ab[..., 1], ab[..., 0])
+    angle = np.abs(np.degrees(radians))
+    return np.where(angle > 180, 360 - angle, angle)
+
+
+# returns: (..., J) summed visibility of each triplet's three landmarks
+def joint_visibility(landmarks, triplets):
+    return landmarks[..., triplets, VISIBILITY].sum(axis=-1)
@@ -0,0 +1,77 @@
+# Memory and time per frame for the /analyze_frame decode path, before the
+# frame arena (fresh arrays per frame) and with it. Pose inference is left
+# out so only decode, resize and colour conversion are measured.
+#
+#   python -m backend.bench_frame_decode [image.jpg] [frames]
+import base64
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from .frame_arena import FrameArena, LIVE_MAX_SIDE, decode_reduction
+
+
+def synthetic_jpeg(w=1280, h=720):
+    x = np.linspace(0, 255, w, dtype=np.uint8)
+    frame = np.dstack([np.tile(x, (h, 1))] * 3)
+    cv2.circle(frame, (w // 2, h // 2), h // 3, (40, 120, 220), -1)
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+def fresh_frame(image_base64):
+    frame = cv2.imdecode(np.frombuffer(base64.b64decode(image_base64), np.uint8), cv2.IMREAD_COLOR)
+    h, w = frame.shape[:2]
+    scale = LIVE_MAX_SIDE / max(h, w)
+    if scale < 1:
+        frame = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def arena_frame(arena, state):
+    def run(image_base64):
+        frame = arena.decode(base64.b64decode(image_base64), state["reduction"])
+        h, w = frame.shape[:2]
+        state["reduction"] = decode_reduction(h * state["reduction"], w * state["reduction"])
+        return arena.to_rgb(frame)
+    return run
+
+
+def measure(name, fn, image_base64, frames):
+    fn(image_base64)  # warm-up: first frame sizes the buffers
+    tracemalloc.start()
+    peaks = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(image_base64)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    print(
+        f"{name:8s} {np.mean(peaks) / 1024:9.1f} KiB peak allocated/frame"
+        f"  {elapsed / frames * 1000:6.2f} ms/frame (traced)"
+    )
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_jpeg()
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    image_base64 = base64.b64encode(data)
+
+    shape = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape
+    print(f"frame {shape[1]}x{shape[0]}, {len(data) / 1024:.0f} KiB JPEG, {frames} frames")
+    measure("before", fresh_frame, image_base64, frames)
+    measure("arena", arena_frame(FrameArena(), {"reduction": 1}), image_base64, frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+# ================= ATOMIC WRITES =================
+# Yields a temp path next to path and moves it into place once the block
+# finishes, so readers only ever see a complete file. The temp name is
+# unique per process and thread; suffix keeps the extension for writers
+# that pick a format from it (cv2.VideoWriter).
+@contextmanager
+def atomic_path(path, suffix=".tmp"):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{suffix}"
+    try:
+        yield tmp_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def write_atomic(path, data):
+    with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+        f.write(data)
+    return path
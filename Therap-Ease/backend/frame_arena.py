@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# ================= LIVE FRAME BUFFERS =================
+LIVE_MAX_SIDE = 320  # longest side fed to the live detector
+ARENA_MAX_SHAPES = 4  # frame sizes kept per worker thread
+
+# JPEGs can be decoded straight to 1/2, 1/4 or 1/8 size
+REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+# Largest decode reduction that still leaves at least max_side pixels
+def decode_reduction(full_h, full_w, max_side=LIVE_MAX_SIDE):
+    for factor in (8, 4, 2):
+        if max(full_h, full_w) // factor >= max_side:
+            return factor
+    return 1
+
+
+# Resize and colour-conversion targets for each decoded frame size, reused
+# across frames. One arena per worker thread, so buffers are never shared
+# between frames in flight.
+class FrameArena:
+    def __init__(self, max_side=LIVE_MAX_SIDE, max_shapes=ARENA_MAX_SHAPES):
+        self.max_side = max_side
+        self.max_shapes = max_shapes
+        self._buffers = OrderedDict()
+
+    def decode(self, data, reduction=1):
+        return cv2.imdecode(np.frombuffer(data, np.uint8), REDUCED_READ_FLAGS[reduction])
+
+    # The returned array is overwritten by the next frame of the same size
+    def to_rgb(self, frame):
+        small, rgb = self._buffers_for(frame.shape[:2])
+        if small is not None:
+            frame = cv2.resize(
+                frame,
+                small.shape[1::-1],
+                dst=small,
+                interpolation=cv2.INTER_AREA,
+            )
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+
+    def _buffers_for(self, shape):
+        buffers = self._buffers.get(shape)
+        if buffers is not None:
+            self._buffers.move_to_end(shape)
+            return buffers
+
+        h, w = shape
+        small = None
+        scale = self.max_side / max(h, w)
+        if scale < 1:
+            h, w = int(h * scale), int(w * scale)
+            small = np.empty((h, w, 3), np.uint8)
+        buffers = (small, np.empty((h, w, 3), np.uint8))
+
+        self._buffers[shape] = buffers
+        if len(self._buffers) > self.max_shapes:
+            self._buffers.popitem(last=False)
+        return buffers
+
+
+_local = threading.local()
+
+
+def frame_arena():
+    arena = getattr(_local, "arena", None)
+    if arena is None:
+        arena = _local.arena = FrameArena()
+    return arena
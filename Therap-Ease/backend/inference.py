@@ -0,0 +1,129 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# ================= WORKER LIMITS =================
+FRAME_WORKERS = int(os.environ.get("FRAME_WORKERS", os.cpu_count() or 4))
+FRAME_QUEUE = int(os.environ.get("FRAME_QUEUE", FRAME_WORKERS * 2))
+VIDEO_WORKERS = int(os.environ.get("VIDEO_WORKERS", 2))
+VIDEO_QUEUE = int(os.environ.get("VIDEO_QUEUE", 4))
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", 2))
+REPORT_QUEUE = int(os.environ.get("REPORT_QUEUE", 8))
+
+LATENCY_SMOOTHING = 0.2  # weight of the newest queue wait in the moving average
+LATENCY_STALE = 2.0      # seconds without a task before the average reads as idle
+
+
+# Thread pool that answers 503 instead of queueing without bound.
+# MediaPipe and OpenCV release the GIL while they run, so threads scale
+# across cores and can share the in-process detector pool.
+class InferenceExecutor:
+    def __init__(self, name, workers, max_queue, retry_after=1):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix=f"{name}-inference",
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Signalled whenever a slot frees up, for run_blocking()
+        self._slot_free = threading.Condition(self._lock)
+        self._queue_latency = 0.0
+        self._last_started = None
+
+    def busy(self):
+        return HTTPException(
+            status_code=503,
+            detail=f"{self.name} inference is busy, retry shortly",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+    # Lets a caller turn work away before doing anything expensive for it;
+    # run() still enforces the limit
+    def check_capacity(self):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise self.busy()
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise self.busy()
+            self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, self._timed(fn, args))
+        finally:
+            self._release_slot()
+
+    # For callers on their own threads (video jobs): waits for a slot
+    # instead of answering 503, then runs on the same workers as run(), so
+    # both count against one limit and one queue latency
+    def run_blocking(self, fn, *args):
+        with self._slot_free:
+            self._slot_free.wait_for(lambda: self._pending < self.workers + self.max_queue)
+            self._pending += 1
+
+        try:
+            return self._pool.submit(self._timed(fn, args)).result()
+        finally:
+            self._release_slot()
+
+    def _timed(self, fn, args):
+        submitted = time.monotonic()
+
+        def timed():
+            self._record_wait(time.monotonic() - submitted)
+            return fn(*args)
+
+        return timed
+
+    def _release_slot(self):
+        with self._slot_free:
+            self._pending -= 1
+            self._slot_free.notify()
+
+    # Moving average of how long tasks waited for a worker, in seconds
+    def queue_latency(self):
+        with self._lock:
+            if self._last_started is None:
+                return 0.0
+            if time.monotonic() - self._last_started > LATENCY_STALE:
+                return 0.0
+            return self._queue_latency
+
+    def _record_wait(self, wait):
+        with self._lock:
+            self._queue_latency += LATENCY_SMOOTHING * (wait - self._queue_latency)
+            self._last_started = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": pending,
+            "queue_latency": self.queue_latency(),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Live frames and uploads get separate pools so a long video can never
+# occupy the workers that live sessions are waiting on.
+frame_executor = InferenceExecutor("frame", FRAME_WORKERS, FRAME_QUEUE)
+video_executor = InferenceExecutor("video", VIDEO_WORKERS, VIDEO_QUEUE, retry_after=10)
+
+# PDF rendering is pure Python; its own pool keeps it off the event loop
+# without taking workers from pose inference.
+report_executor = InferenceExecutor("report", REPORT_WORKERS, REPORT_QUEUE)
@@ -0,0 +1,168 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException
+
+from .database import SessionLocal
+from .models import VideoJob
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "progress": job.progress,
+        "video_id": job.video_id,
+        "input_path": job.input_path,
+        "content_hash": job.content_hash,
+        "exercise_key": job.exercise_key,
+        "params": json.loads(job.params),
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+    }
+
+
+# Video analysis jobs persisted in the app database and worked by a small
+# pool of in-process threads. Queued and interrupted jobs are picked up
+# again on startup, so a restart never loses accepted work.
+class JobQueue:
+    def __init__(self, handler, workers=JOB_WORKERS):
+        # handler(job_dict, progress) -> JSON-serializable result
+        self.handler = handler
+        self.workers = workers
+        self._queue = queue.Queue()
+        self._threads = []
+        self._submit_lock = threading.Lock()
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            pending = (
+                db.query(VideoJob)
+                .filter(VideoJob.status.in_(["queued", "running"]))
+                .order_by(VideoJob.created_at)
+                .all()
+            )
+            for job in pending:
+                job.status = "queued"
+            db.commit()
+            job_ids = [job.id for job in pending]
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            self._queue.put(job_id)
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"video-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+
+    # Returns (job_dict, created). A job that is queued, running or done for
+    # the same dedup_key is returned instead of creating a new one.
+    def submit(self, dedup_key, **fields):
+        with self._submit_lock:
+            db = SessionLocal()
+            try:
+                existing = (
+                    db.query(VideoJob)
+                    .filter(VideoJob.dedup_key == dedup_key, VideoJob.status != "failed")
+                    .order_by(VideoJob.created_at.desc())
+                    .first()
+                )
+                if existing is not None:
+                    return job_to_dict(existing), False
+
+                job = VideoJob(
+                    id=uuid.uuid4().hex,
+                    dedup_key=dedup_key,
+                    status="queued",
+                    progress=0.0,
+                    params=json.dumps(fields.pop("params", {})),
+                    **fields,
+                )
+                db.add(job)
+                db.commit()
+                db.refresh(job)
+                created = job_to_dict(job)
+            finally:
+                db.close()
+
+        self._queue.put(created["job_id"])
+        return created, True
+
+    def get(self, job_id):
+        db = SessionLocal()
+        try:
+            job = db.get(VideoJob, job_id)
+            return job_to_dict(job) if job is not None else None
+        finally:
+            db.close()
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._run(job_id)
+
+    def _run(self, job_id):
+        db = SessionLocal()
+        try:
+            job = db.get(VideoJob, job_id)
+            if job is None or job.status in ("done", "failed"):
+                return
+
+            job.status = "running"
+            db.commit()
+
+            try:
+                result = self.handler(job_to_dict(job), self._progress_writer(job_id))
+                job.result = json.dumps(result)
+                job.progress = 1.0
+                job.status = "done"
+            except HTTPException as e:
+                job.error = str(e.detail)
+                job.status = "failed"
+            except Exception as e:
+                job.error = f"Video analysis failed: {e}"
+                job.status = "failed"
+
+            if job.status == "failed" and os.path.exists(job.input_path):
+                # Nothing refers to the upload of a failed job; a retry
+                # uploads it again
+                os.remove(job.input_path)
+            db.commit()
+        finally:
+            db.close()
+
+    def _progress_writer(self, job_id):
+        last = {"at": 0.0}
+
+        def progress(fraction):
+            now = time.monotonic()
+            if now - last["at"] < PROGRESS_INTERVAL:
+                return
+            last["at"] = now
+
+            db = SessionLocal()
+            try:
+                db.query(VideoJob).filter(VideoJob.id == job_id).update(
+                    {"progress": float(fraction)}
+                )
+                db.commit()
+            finally:
+                db.close()
+
+        return progress
@@ -0,0 +1,198 @@
+import struct
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # optional; without it msgpack is simply not offered
+    msgpack = None
+
+from .model_tiers import TIER_NAMES
+from .landmarks import LANDMARK_INDEX, LANDMARK_NAMES, NUM_LANDMARKS, X, Y, VISIBILITY
+
+# ================= KEYPOINTS SENT TO CLIENTS =================
+NEEDED_KEYS = {
+    "bicep_curl": [
+        "left_shoulder", "left_elbow", "left_wrist",
+        "right_shoulder", "right_elbow", "right_wrist",
+    ],
+    "squat": [
+        "left_hip", "left_knee", "left_ankle",
+        "right_hip", "right_knee", "right_ankle",
+    ],
+    "shoulder_abduction": [
+        "left_shoulder", "left_elbow",
+        "right_shoulder", "right_elbow",
+    ],
+    "knee_extension": [
+        "left_hip", "left_knee",
+        "right_hip", "right_knee",
+    ],
+    "leg_raise": [
+        "left_hip", "left_knee", "left_ankle",
+        "right_hip", "right_knee", "right_ankle",
+    ],
+    "side_bend": [
+        "left_shoulder", "right_shoulder",
+        "left_hip", "right_hip",
+    ],
+}
+
+ALL_KEYPOINTS = np.arange(NUM_LANDMARKS)
+
+# Landmark indices per exercise in landmark order, built once at import
+KEYPOINT_INDICES = {
+    key: np.array(sorted(LANDMARK_INDEX[name] for name in names), dtype=np.intp)
+    for key, names in NEEDED_KEYS.items()
+}
+
+KEYPOINT_COLUMNS = [X, Y, VISIBILITY]
+COMPACT_DECIMALS = 4  # normalized coordinates; finer than a pixel at 4K
+
+# Bumped whenever the compact order or the packed layout changes
+KEYPOINT_SCHEMA_VERSION = 1
+
+
+def keypoint_indices(exercise_key):
+    return KEYPOINT_INDICES.get(exercise_key, ALL_KEYPOINTS)
+
+
+# [{"name", "x", "y", "score"}, ...] for the exercise's landmarks
+def verbose_keypoints(landmarks, exercise_key):
+    indices = keypoint_indices(exercise_key)
+    rows = landmarks[np.ix_(indices, KEYPOINT_COLUMNS)].tolist()
+    return [
+        {"name": LANDMARK_NAMES[idx], "x": x, "y": y, "score": score}
+        for idx, (x, y, score) in zip(indices.tolist(), rows)
+    ]
+
+
+# Flat [x0, y0, score0, x1, ...] in the order given by keypoint_schema()
+def compact_keypoints(landmarks, exercise_key):
+    indices = keypoint_indices(exercise_key)
+    values = landmarks[np.ix_(indices, KEYPOINT_COLUMNS)].astype(np.float64)
+    return values.round(COMPACT_DECIMALS).ravel().tolist()
+
+
+# (N, 3) float32 x, y, score in the same order as compact_keypoints
+def packed_keypoints(landmarks, exercise_key):
+    indices = keypoint_indices(exercise_key)
+    return np.ascontiguousarray(landmarks[np.ix_(indices, KEYPOINT_COLUMNS)], dtype=np.float32)
+
+
+KEYPOINT_FORMATS = {
+    "verbose": verbose_keypoints,
+    "compact": compact_keypoints,
+    "packed": packed_keypoints,
+}
+
+
+# landmarks is None when no pose was found
+def serialize_keypoints(landmarks, exercise_key, keypoint_format="verbose"):
+    if landmarks is None:
+        return np.empty((0, 3), np.float32) if keypoint_format == "packed" else []
+    return KEYPOINT_FORMATS[keypoint_format](landmarks, exercise_key)
+
+
+# Name table for compact and packed responses; clients fetch it once
+def keypoint_schema():
+    return {
+        "version": KEYPOINT_SCHEMA_VERSION,
+        "names": LANDMARK_NAMES,
+        "fields": ["x", "y", "score"],
+        "exercises": {key: indices.tolist() for key, indices in KEYPOINT_INDICES.items()},
+        "default": ALL_KEYPOINTS.tolist(),
+    }
+
+
+# ================= BINARY FRAME RESPONSES =================
+MSGPACK = "application/msgpack"
+OCTET_STREAM = "application/octet-stream"
+
+# application/octet-stream layout, little-endian, followed by N * 3 float32:
+#   uint8 version | uint8 flags | uint16 N | uint16 reps | int8 stage |
+#   int8 active_side | float32 angle | float32 form_score
+# stage and active_side are -1 when unknown; angle and form_score are NaN.
+PACKED_HEADER = struct.Struct("<BBHHbbff")
+# flags: bit 0 rep detected, bits 1-2 model tier index (lite, full, heavy)
+PACKED_REP_DETECTED = 1
+PACKED_TIER_SHIFT = 1
+
+STAGE_CODES = {"up": 0, "down": 1}
+SIDE_CODES = {"left": 0, "right": 1}
+
+
+JSON_RANGES = ("application/json", "application/*", "*/*")
+
+
+# {media range: q} from an Accept header; a bad q counts as 0
+def accept_qualities(accept):
+    qualities = {}
+    for item in (accept or "").split(","):
+        media_range, *params = [part.strip() for part in item.split(";")]
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        media_range = media_range.lower()
+        qualities[media_range] = max(q, qualities.get(media_range, 0.0))
+    return qualities
+
+
+# Binary media type the Accept header asks for, or None for JSON. Binary
+# types must be named explicitly with q > 0 and rank at least as high as
+# JSON; wildcards alone keep JSON.
+def binary_media_type(accept):
+    qualities = accept_qualities(accept)
+    json_q = max(qualities.get(media_range, 0.0) for media_range in JSON_RANGES)
+
+    # max keeps the first of equal entries, so msgpack wins a tie
+    offered = [MSGPACK, OCTET_STREAM] if msgpack is not None else [OCTET_STREAM]
+    best = max(offered, key=lambda media_type: qualities.get(media_type, 0.0))
+    best_q = qualities.get(best, 0.0)
+    if best_q > 0 and best_q >= json_q:
+        return best
+    return None
+
+
+def nan_if_none(value):
+    return float("nan") if value is None else value
+
+
+def encode_packed(keypoints, reps, model_tier):
+    flags = TIER_NAMES.index(model_tier) << PACKED_TIER_SHIFT
+    if reps["rep_detected"]:
+        flags |= PACKED_REP_DETECTED
+
+    header = PACKED_HEADER.pack(
+        KEYPOINT_SCHEMA_VERSION,
+        flags,
+        len(keypoints),
+        reps["reps"],
+        STAGE_CODES.get(reps["stage"], -1),
+        SIDE_CODES.get(reps["active_side"], -1),
+        nan_if_none(reps["angle"]),
+        nan_if_none(reps["form_score"]),
+    )
+    return header + keypoints.tobytes()
+
+
+def encode_msgpack(keypoints, reps, model_tier):
+    return msgpack.packb({
+        "version": KEYPOINT_SCHEMA_VERSION,
+        "keypoints": keypoints.tobytes(),
+        "reps": reps,
+        "model_tier": model_tier,
+    })
+
+
+BINARY_ENCODERS = {
+    MSGPACK: encode_msgpack,
+    OCTET_STREAM: encode_packed,
+}
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+import threading
+
+from .files import atomic_path
+from .video_pipeline import save_track, load_track
+
+LANDMARK_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+# Same bytes + same model parameters => same landmark track
+def cache_key(content_hash, params):
+    payload = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(f"{content_hash}:{payload}".encode()).hexdigest()
+
+
+# Disk cache of extracted landmark tracks with least-recently-used eviction
+# once the directory grows past max_bytes. Hits refresh the file's mtime.
+class LandmarkCache:
+    def __init__(self, directory, max_bytes=LANDMARK_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)
+            return load_track(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+    def put(self, key, data):
+        path = self.path(key)
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+            save_track(f, data)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".npz"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -0,0 +1,35 @@
+import numpy as np
+
+# MediaPipe Pose landmark order (mp.solutions.pose.PoseLandmark)
+LANDMARK_NAMES = [
+    "nose",
+    "left_eye_inner", "left_eye", "left_eye_outer",
+    "right_eye_inner", "right_eye", "right_eye_outer",
+    "left_ear", "right_ear",
+    "mouth_left", "mouth_right",
+    "left_shoulder", "right_shoulder",
+    "left_elbow", "right_elbow",
+    "left_wrist", "right_wrist",
+    "left_pinky", "right_pinky",
+    "left_index", "right_index",
+    "left_thumb", "right_thumb",
+    "left_hip", "right_hip",
+    "left_knee", "right_knee",
+    "left_ankle", "right_ankle",
+    "left_heel", "right_heel",
+    "left_foot_index", "right_foot_index",
+]
+
+LANDMARK_INDEX = {name: idx for idx, name in enumerate(LANDMARK_NAMES)}
+
+NUM_LANDMARKS = len(LANDMARK_NAMES)
+
+# Columns of a landmark row
+X, Y, Z, VISIBILITY = range(4)
+
+
+def landmarks_to_array(landmarks):
+    return np.array(
+        [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks],
+        dtype=np.float32,
+    )
@@ -1,16 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import Literal
 import os
 import time
+import uuid
+import struct
+import asyncio
 import base64
-import cv2
-import numpy as np
-import mediapipe as mp
-from fpdf import FPDF
+import hashlib
+import zipfile
 from datetime import datetime
 
 from .database import Base, engine, SessionLocal
@@ -25,9 +27,80 @@ from .auth import (
     verify_password,
     create_access_token
 )
+from .pose_pool import PosePool
+from .inference import frame_executor, video_executor, report_executor
+from .model_tiers import (
+    MODEL_TIERS,
+    LIVE_MODEL_TIER,
+    VIDEO_MODEL_TIER,
+    LIVE_LATENCY_TARGET,
+    VIDEO_LATENCY_TARGET,
+    TierController,
+)
+from .jobs import JobQueue
+from .landmarks import landmarks_to_array
+from .keypoints import (
+    serialize_keypoints,
+    keypoint_schema,
+    binary_media_type,
+    BINARY_ENCODERS,
+)
+from .frame_arena import frame_arena, decode_reduction
+from .rep_counter import REP_RULES
+from .session_report import track_angles
+from .session_store import (
+    save_session,
+    save_recording,
+    session_to_dict,
+    session_history,
+    session_progress,
+    session_detail,
+    stored_report_fields,
+    report_assets,
+    HISTORY_LIMIT,
+)
+from .report_pdf import (
+    normalize_report_payload,
+    report_key,
+    report_filename,
+    render_report,
+    render_combined_report,
+    write_report,
+    save_report,
+    report_pool,
+    shutdown_report_pool,
+    ZipChunks,
+    REPORT_BATCH_MAX,
+    REPORT_ARCHIVE,
+    PDF,
+)
+from .landmark_cache import LandmarkCache, cache_key
+from .upload_limit import UploadLimit, UPLOAD_CHUNK, MAX_UPLOAD_BYTES, upload_too_large
+from .video_pipeline import (
+    POSE_PARAMS,
+    extract_video,
+    save_track,
+    load_track,
+    track_path,
+    track_params,
+    render_overlay,
+    SAMPLE_STRIDE,
+    analyze_track,
+    shutdown_segment_pool
+)
 
 app = FastAPI()
 
+# Size limit and backpressure for uploads, checked before the body is
+# read; added first so CORS headers still wrap its 413/503 responses
+app.add_middleware(
+    UploadLimit,
+    paths={
+        "/analyze_video": video_executor.check_capacity,
+        "/jobs/analyze_video": None,
+    },
+)
+
 # ================= CORS MIDDLEWARE =================
 app.add_middleware(
     CORSMiddleware,
@@ -50,56 +123,75 @@ def get_db():
 # ================= DIRECTORIES & STATIC FILES =================
 REPORT_DIR = "reports"
 VIDEO_DIR = "videos"
+CACHE_DIR = "cache"
+OVERLAY_DIR = os.path.join(CACHE_DIR, "overlays")
+CHART_DIR = os.path.join(CACHE_DIR, "charts")
 
 os.makedirs(REPORT_DIR, exist_ok=True)
 os.makedirs(VIDEO_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(OVERLAY_DIR, exist_ok=True)
+os.makedirs(CHART_DIR, exist_ok=True)
 
 app.mount("/reports", StaticFiles(directory=REPORT_DIR), name="reports")
 app.mount("/videos", StaticFiles(directory=VIDEO_DIR), name="videos")
 
 # ================= MEDIAPIPE SETUP =================
-mp_pose = mp.solutions.pose
-
-pose_detector = mp_pose.Pose(
-    static_image_mode=False,
-    model_complexity=0,
-    enable_segmentation=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-)
-
-# ================= EXERCISE → REQUIRED KEYPOINTS =================
-NEEDED_KEYS = {
-    "bicep_curl": [
-        "left_shoulder", "left_elbow", "left_wrist",
-        "right_shoulder", "right_elbow", "right_wrist",
-    ],
-    "squat": [
-        "left_hip", "left_knee", "left_ankle",
-        "right_hip", "right_knee", "right_ankle",
-    ],
-    "shoulder_abduction": [
-        "left_shoulder", "left_elbow",
-        "right_shoulder", "right_elbow",
-    ],
-    "knee_extension": [
-        "left_hip", "left_knee",
-        "right_hip", "right_knee",
-    ],
-    "leg_raise": [
-        "left_hip", "left_knee", "left_ankle",
-        "right_hip", "right_knee", "right_ankle",
-    ],
-    "side_bend": [
-        "left_shoulder", "right_shoulder",
-        "left_hip", "right_hip",
-    ],
-}
+landmark_cache = LandmarkCache(os.path.join(CACHE_DIR, "landmarks"))
+
+# Live sessions are written to the database once, when they close
+def save_live_session(session):
+    if session.patient_id is None:
+        return
+    for recording in session.recordings:
+        save_recording(recording, session.patient_id)
+
+# One tracking detector per live session so patients never share landmark state
+pose_pool = PosePool(on_close=save_live_session)
+
+# Step requests down a model tier while their executor's queue is slow
+frame_tiers = TierController(frame_executor, LIVE_LATENCY_TARGET)
+video_tiers = TierController(video_executor, VIDEO_LATENCY_TARGET)
+
+@app.on_event("startup")
+def warm_pose_pool():
+    pose_pool.warm()
+    pose_pool.start_sweeper()
+    video_jobs.start()
+
+@app.on_event("shutdown")
+def shutdown_inference():
+    video_jobs.stop()
+    shutdown_segment_pool()
+    frame_executor.shutdown()
+    video_executor.shutdown()
+    report_executor.shutdown()
+    shutdown_report_pool()
+    pose_pool.close()
 
 # ================= MODELS =================
 class FrameRequest(BaseModel):
     image_base64: str
     exercise_key: str | None = None
+    session_id: str | None = None
+    # "compact": flat [x, y, score, ...] in the order from /keypoint_schema
+    format: Literal["verbose", "compact"] = "verbose"
+    # Highest tier wanted; may be lowered under load, see response model_tier
+    model_tier: Literal["lite", "full", "heavy"] | None = None
+    # Stores the session under this patient when it ends
+    patient_id: str | None = None
+
+class BatchReportRequest(BaseModel):
+    reports: list[dict]
+    # "manifest": a URL per report; "pdf": one document with every report;
+    # "zip": the individual PDFs, streamed as each finishes rendering
+    output: Literal["manifest", "pdf", "zip"] = "manifest"
+
+class RescoreRequest(BaseModel):
+    video_id: str
+    exercise_key: str
+    extended: float | None = None
+    flexed: float | None = None
 
 # ================= AUTH ENDPOINTS =================
 @app.post("/register")
@@ -168,62 +260,280 @@ def login(
     }
 
 # ================= LIVE FRAME ANALYSIS =================
-@app.post("/analyze_frame")
-async def analyze_frame(req: FrameRequest):
-    try:
-        img_data = base64.b64decode(req.image_base64)
-        np_img = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+# keypoint_format: "verbose", "compact" or "packed", see backend/keypoints.py
+# model_tier: requested tier; frame_tiers may cap it while the queue is slow
+def process_frame(
+    img_data,
+    exercise_key,
+    session_id,
+    timestamp=None,
+    keypoint_format="verbose",
+    model_tier=None,
+    patient_id=None,
+):
+    tier = frame_tiers.cap(model_tier or LIVE_MODEL_TIER)
+    session = pose_pool.get(session_id, tier)
+    arena = frame_arena()
+
+    with session.frame_lock:
+        if patient_id:
+            session.patient_id = patient_id
 
+        reduction = session.decode_reduction
+        frame = arena.decode(img_data, reduction)
         if frame is None:
             raise HTTPException(status_code=400, detail="Invalid image")
 
-        # Downscale for speed
-        h, w = frame.shape[:2]
-        max_side = 320
-        scale = max_side / max(h, w)
-        if scale < 1:
-            frame = cv2.resize(
-                frame,
-                (int(w * scale), int(h * scale)),
-                interpolation=cv2.INTER_AREA,
-            )
-
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose_detector.process(rgb)
-
-        if not results.pose_landmarks:
-            return {"pose": {"keypoints": []}}
-
-        wanted = None
-        if req.exercise_key:
-            wanted = NEEDED_KEYS.get(req.exercise_key)
-
-        keypoints = []
-        for idx, lm in enumerate(results.pose_landmarks.landmark):
-            name = mp_pose.PoseLandmark(idx).name.lower()
-
-            if wanted and name not in wanted:
-                continue
-
-            keypoints.append({
-                "name": name,
-                "x": float(lm.x),
-                "y": float(lm.y),
-                "score": float(lm.visibility),
-            })
+        t = timestamp if timestamp is not None else time.monotonic()
+        if session.gate.still(frame, session.last_landmarks is not None):
+            # Nothing moved since the last inferred frame; reuse its landmarks
+            landmarks = session.last_landmarks
+            rep_state = session.count_reps(exercise_key, None, t)
+        else:
+            landmarks = infer_landmarks(session, arena, frame, reduction, t)
+            session.last_landmarks = landmarks
+            rep_state = session.count_reps(exercise_key, landmarks, t)
+        frame_stats = session.gate.stats()
+
+    keypoints = serialize_keypoints(landmarks, exercise_key, keypoint_format)
+    return {
+        "pose": {"keypoints": keypoints},
+        "reps": rep_state,
+        "model_tier": session.tier,
+        "frames": frame_stats,
+    }
+
+# Smoothed full-frame (33, 4) landmarks, or None when no pose was found
+def infer_landmarks(session, arena, frame, reduction, t):
+    h, w = frame.shape[:2]
+    full_w, full_h = w * reduction, h * reduction
+
+    # Infer on a crop around the patient when the last frame found one
+    crop, region = session.roi.crop(frame, reduction)
+    if session.roi.changed:
+        session.reset_tracking()
+    results = session.process(arena.to_rgb(crop))
+
+    landmarks = None
+    if results is not None and results.pose_landmarks:
+        landmarks = landmarks_to_array(results.pose_landmarks.landmark)
+        landmarks = session.roi.to_frame(landmarks, region, full_w, full_h)
+        landmarks = session.smooth(landmarks, t)
+    session.roi.update(landmarks, full_w, full_h)
+
+    # Later frames decode straight to about the size we infer at
+    roi_w, roi_h = session.roi.size(full_w, full_h)
+    session.decode_reduction = decode_reduction(roi_h, roi_w, arena.max_side)
+    return landmarks
+
+def process_base64_frame(
+    image_base64,
+    exercise_key,
+    session_id,
+    keypoint_format="verbose",
+    model_tier=None,
+    patient_id=None,
+):
+    return process_frame(
+        base64.b64decode(image_base64),
+        exercise_key,
+        session_id,
+        keypoint_format=keypoint_format,
+        model_tier=model_tier,
+        patient_id=patient_id,
+    )
 
-        return {"pose": {"keypoints": keypoints}}
+@app.post("/analyze_frame")
+async def analyze_frame(req: FrameRequest, request: Request):
+    # Older clients send no session id; fall back to one session per address
+    session_id = req.session_id or f"client:{request.client.host}"
+    # Binary Accept types get packed float32 keypoints; JSON stays the default
+    media_type = binary_media_type(request.headers.get("accept"))
 
+    try:
+        result = await frame_executor.run(
+            process_base64_frame,
+            req.image_base64,
+            req.exercise_key,
+            session_id,
+            "packed" if media_type else req.format,
+            req.model_tier,
+            req.patient_id,
+        )
+    except HTTPException:
+        raise
     except Exception:
         raise HTTPException(status_code=500, detail="Frame processing failed")
 
+    if media_type is None:
+        return result
+
+    content = BINARY_ENCODERS[media_type](
+        result["pose"]["keypoints"], result["reps"], result["model_tier"]
+    )
+    return Response(content=content, media_type=media_type)
+
+@app.delete("/analyze_frame/{session_id}")
+def end_frame_session(session_id: str):
+    pose_pool.release(session_id)
+    return {"message": "Session closed"}
+
+# Landmark names and per-exercise order for compact keypoint responses
+@app.get("/keypoint_schema")
+def get_keypoint_schema():
+    return keypoint_schema()
+
+# ================= LIVE FRAME STREAM =================
+# Binary frame message: little-endian header followed by raw JPEG bytes
+#   uint32 seq | float64 timestamp_ms | uint8 key_len | exercise_key (utf-8)
+FRAME_HEADER = struct.Struct("<IdB")
+
+def parse_frame_message(message):
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError("Frame message too short")
+
+    seq, timestamp, key_len = FRAME_HEADER.unpack_from(message)
+    key_end = FRAME_HEADER.size + key_len
+    exercise_key = message[FRAME_HEADER.size:key_end].decode("utf-8") or None
+
+    return seq, timestamp, exercise_key, message[key_end:]
+
+# Query params: session_id, format=compact, model_tier and patient_id, as in FrameRequest
+@app.websocket("/ws/analyze")
+async def analyze_stream(websocket: WebSocket):
+    await websocket.accept()
+    session_id = websocket.query_params.get("session_id") or f"ws:{uuid.uuid4().hex}"
+    keypoint_format = "compact" if websocket.query_params.get("format") == "compact" else "verbose"
+    model_tier = websocket.query_params.get("model_tier")
+    if model_tier not in MODEL_TIERS:
+        model_tier = None
+    patient_id = websocket.query_params.get("patient_id")
+
+    # Holds only the newest unprocessed frame; older ones are dropped
+    latest = asyncio.Queue(maxsize=1)
+    counters = {"received": 0, "dropped": 0}
+
+    def offer(frame):
+        if latest.full():
+            latest.get_nowait()
+            counters["dropped"] += 1
+        latest.put_nowait(frame)
+
+    async def receive():
+        last_seq = -1
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+
+                data = message.get("bytes")
+                if not data:
+                    continue
+
+                try:
+                    frame = parse_frame_message(data)
+                except (ValueError, UnicodeDecodeError):
+                    continue
+
+                counters["received"] += 1
+                if frame[0] <= last_seq:
+                    counters["dropped"] += 1
+                    continue
+
+                last_seq = frame[0]
+                offer(frame)
+        finally:
+            offer(None)
+
+    receiver = asyncio.create_task(receive())
+
+    try:
+        while True:
+            frame = await latest.get()
+            if frame is None:
+                break
+
+            seq, timestamp, exercise_key, img_data = frame
+            try:
+                result = await frame_executor.run(
+                    process_frame, img_data, exercise_key, session_id,
+                    timestamp / 1000.0, keypoint_format, model_tier, patient_id,
+                )
+            except HTTPException as e:
+                if e.status_code == 503:
+                    counters["dropped"] += 1
+                    continue
+                result = {"error": e.detail}
+            except Exception:
+                result = {"error": "Frame processing failed"}
+
+            await websocket.send_json({
+                "seq": seq,
+                "timestamp": timestamp,
+                **result,
+                **counters,
+            })
+    except (WebSocketDisconnect, RuntimeError):
+        # Client went away mid-send; nothing left to report to
+        pass
+    finally:
+        receiver.cancel()
+        # Closing waits for any in-flight frame and stores the session;
+        # keep both off the event loop
+        await asyncio.to_thread(pose_pool.release, session_id)
+
 # ================= VIDEO ANALYSIS =================
-def calculate_angle(a, b, c):
-    a, b, c = np.array(a), np.array(b), np.array(c)
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    angle = abs(radians * 180 / np.pi)
-    return 360 - angle if angle > 180 else angle
+# Copies the upload to disk one chunk at a time, hashing as it goes, so
+# memory use no longer grows with video size. Returns the SHA-256.
+async def save_upload(file, path):
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise upload_too_large()
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    return digest.hexdigest()
+
+async def receive_video(file):
+    ext = os.path.splitext(file.filename or "video.mp4")[1]
+    # Suffix keeps uploads landing in the same second apart
+    video_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    input_path = os.path.join(VIDEO_DIR, f"{video_id}{ext}")
+    content_hash = await save_upload(file, input_path)
+    return video_id, input_path, content_hash
+
+def video_response(stats, exercise_key, patient):
+    return {
+        "session_id": stats["session_id"],
+        "video_id": stats["video_id"],
+        "video_url": f"/videos/{stats['video_file']}",
+        # Rendered on first request, see get_processed_video
+        "processed_video_url": f"/processed_videos/{stats['video_id']}/{exercise_key}.mp4",
+        "exercise_key": exercise_key,
+        "patient_name": patient["patient_name"],
+        "patient_id": patient["patient_id"],
+        "reps": stats["reps"],
+        "assigned_reps": patient["assigned_reps"],
+        "sets": patient["sets"],
+        "duration": stats["duration"],
+        "avg_time": stats["avg_time"],
+        "form_score": stats["form_score"],
+        "frames": stats["frames"],
+        "frames_inferred": stats["frames_inferred"],
+        "model_tier": stats["model_tier"],
+        "cached": stats["cached"],
+    }
 
 @app.post("/analyze_video")
 async def analyze_video(
@@ -233,361 +543,462 @@ async def analyze_video(
     patient_id: str = Form("P-2025-001"),
     assigned_reps: int = Form(10),
     sets: int = Form(1),
+    # Opt-in until rep counts are shown to match full inference on real clips
+    adaptive_sampling: bool = Form(False),
+    model_tier: Literal["lite", "full", "heavy"] = Form(VIDEO_MODEL_TIER),
 ):
-    ext = os.path.splitext(file.filename or "video.mp4")[1]
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    input_path = os.path.join(VIDEO_DIR, f"{ts}{ext}")
-    output_path = os.path.join(VIDEO_DIR, f"proc_{ts}.mp4")
-
-    with open(input_path, "wb") as f:
-        f.write(await file.read())
-
-    cap = cv2.VideoCapture(input_path)
-    if not cap.isOpened():
-        raise HTTPException(status_code=400, detail="Video open failed")
-
-    fps = cap.get(cv2.CAP_PROP_FPS) or 30
-    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+    video_id, input_path, content_hash = await receive_video(file)
 
-    reps, stage = 0, None
-    rep_times, scores = [], []
-    start = time.time()
-    last_rep = None
-
-    # Keep per-side stages for arm-based exercises
-    side_stage = {"LEFT": None, "RIGHT": None}
-
-    with mp_pose.Pose(model_complexity=1) as pose:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            res = pose.process(rgb)
-
-            if not res.pose_landmarks:
-                out.write(frame)
-                continue
-
-            lm = res.pose_landmarks.landmark
-            angles = []
-
-            if exercise_key in ["squat", "knee_extension", "leg_raise"]:
-                for side in ["LEFT", "RIGHT"]:
-                    hip = lm[getattr(mp_pose.PoseLandmark, f"{side}_HIP").value]
-                    knee = lm[getattr(mp_pose.PoseLandmark, f"{side}_KNEE").value]
-                    ankle = lm[getattr(mp_pose.PoseLandmark, f"{side}_ANKLE").value]
-                    angles.append(calculate_angle(
-                        [hip.x, hip.y],
-                        [knee.x, knee.y],
-                        [ankle.x, ankle.y],
-                    ))
-
-            # Bicep curl / shoulder abduction: evaluate both arms and pick active
-            if exercise_key in ["bicep_curl", "shoulder_abduction"]:
-                side_angles = {}
-                side_vis = {}
-                for side in ["LEFT", "RIGHT"]:
-                    try:
-                        s = lm[getattr(mp_pose.PoseLandmark, f"{side}_SHOULDER").value]
-                        e = lm[getattr(mp_pose.PoseLandmark, f"{side}_ELBOW").value]
-                        wpt = lm[getattr(mp_pose.PoseLandmark, f"{side}_WRIST").value]
-                    except Exception:
-                        continue
-
-                    vis_sum = float(s.visibility + e.visibility + wpt.visibility)
-                    side_vis[side] = vis_sum
-                    a = calculate_angle([s.x, s.y], [e.x, e.y], [wpt.x, wpt.y])
-                    side_angles[side] = a
-
-                active_side = None
-                if side_vis:
-                    active_side = max(side_vis, key=side_vis.get)
-
-                if active_side and active_side in side_angles:
-                    angle = float(side_angles[active_side])
-
-                    cur_stage = side_stage.get(active_side)
-
-                    if angle > 150:
-                        side_stage[active_side] = "down"
-                    if angle < 50 and cur_stage == "down":
-                        side_stage[active_side] = "up"
-                        reps += 1
-                        scores.append(calculate_form_score(exercise_key, angle))
-                        now = time.time()
-                        if last_rep is not None:
-                            rep_times.append(now - last_rep)
-                        last_rep = now
-
-                    # Draw overlay for active arm
-                    if active_side:
-                        s = lm[getattr(mp_pose.PoseLandmark, f"{active_side}_SHOULDER").value]
-                        e = lm[getattr(mp_pose.PoseLandmark, f"{active_side}_ELBOW").value]
-                        wpt = lm[getattr(mp_pose.PoseLandmark, f"{active_side}_WRIST").value]
-
-                        sx, sy = int(s.x * w), int(s.y * h)
-                        ex, ey = int(e.x * w), int(e.y * h)
-                        wx, wy = int(wpt.x * w), int(wpt.y * h)
-
-                        cv2.line(frame, (sx, sy), (ex, ey), (255, 255, 0), 3)
-                        cv2.line(frame, (ex, ey), (wx, wy), (255, 255, 0), 3)
-                        cv2.circle(frame, (sx, sy), 6, (255, 255, 0), -1)
-                        cv2.circle(frame, (ex, ey), 6, (255, 255, 0), -1)
-                        cv2.circle(frame, (wx, wy), 6, (255, 255, 0), -1)
-
-            if angles:
-                angle = float(np.mean(angles))
-                if angle > 160:
-                    stage = "up"
-                if angle < 100 and stage == "up":
-                    reps += 1
-                    scores.append(calculate_form_score(exercise_key, angle))
-                    if last_rep is not None:
-                        rep_times.append(time.time() - last_rep)
-                    last_rep = time.time()
-
-            out.write(frame)
-
-    cap.release()
-    out.release()
-
-    duration = time.time() - start
-    avg_time = float(np.mean(rep_times)) if rep_times else 0.0
-    form_score = float(np.mean(scores) / 100.0) if scores else 0.8
-
-    return {
-        "video_url": f"/videos/{os.path.basename(input_path)}",
-        "processed_video_url": f"/videos/{os.path.basename(output_path)}",
-        "exercise_key": exercise_key,
+    patient = {
         "patient_name": patient_name,
         "patient_id": patient_id,
-        "reps": reps,
         "assigned_reps": assigned_reps,
         "sets": sets,
-        "duration": duration,
-        "avg_time": avg_time,
-        "form_score": form_score,
     }
-
-# ================= PDF REPORT =================
-def generate_ai_physio_review(form_score, avg_time, reps, assigned_reps):
-    remarks = []
-
-    if form_score >= 85:
-        remarks.append(
-            "The patient demonstrated excellent movement quality with consistent joint alignment."
-        )
-    elif form_score >= 70:
-        remarks.append(
-            "Overall technique was good, though minor deviations were observed during certain repetitions."
+    try:
+        stats = await video_executor.run(
+            process_video,
+            video_id,
+            input_path,
+            content_hash,
+            exercise_key,
+            patient,
+            SAMPLE_STRIDE if adaptive_sampling else 1,
+            video_tiers.cap(model_tier),
         )
+    except BaseException:
+        # Busy or failed: nothing refers to the upload, so don't keep it
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        raise
+
+    return video_response(stats, exercise_key, patient)
+
+# sample_stride > 1 runs the model on every Nth frame away from rep thresholds.
+# The analysed session is stored for patient (see video_response fields).
+def process_video(
+    video_id,
+    input_path,
+    content_hash,
+    exercise_key,
+    patient,
+    sample_stride=1,
+    model_tier=VIDEO_MODEL_TIER,
+    progress=None,
+):
+    params = {**POSE_PARAMS, "model_complexity": MODEL_TIERS[model_tier]}
+    key = cache_key(content_hash, track_params(exercise_key, sample_stride, params))
+    data = landmark_cache.get(key)
+
+    if data is not None and os.path.exists(os.path.join(VIDEO_DIR, data["video_file"])):
+        # Same clip was analyzed before: drop the duplicate upload, reuse its track
+        os.remove(input_path)
+        cached = True
     else:
-        remarks.append(
-            "Movement quality was inconsistent, indicating the need for corrective supervision."
+        data = extract_video(
+            input_path,
+            exercise_key,
+            params,
+            progress=progress,
+            sample_stride=sample_stride,
         )
+        data["video_id"] = video_id
+        data["video_file"] = os.path.basename(input_path)
+        save_track(track_path(VIDEO_DIR, video_id), data)
+        landmark_cache.put(key, data)
+        cached = False
 
-    if avg_time < 3:
-        remarks.append(
-            "Repetitions were performed in a slow and controlled manner, appropriate for rehabilitation."
-        )
-    elif avg_time < 7:
-        remarks.append(
-            "Movement tempo was appropriate and well controlled."
-        )
-    else:
-        remarks.append(
-            "Repetitions were performed at a faster pace; controlled tempo is recommended."
-        )
+    stats = analyze_track(data, exercise_key)
+    return {
+        **stats,
+        "session_id": record_video_session(data, stats, exercise_key, patient),
+        "video_id": data["video_id"],
+        "video_file": data["video_file"],
+        "model_tier": model_tier,
+        "cached": cached,
+    }
 
-    if reps >= assigned_reps:
-        remarks.append(
-            "The prescribed exercise volume was successfully completed."
-        )
-    else:
-        remarks.append(
-            "The patient was unable to complete the prescribed volume, possibly due to fatigue."
-        )
+def record_video_session(data, stats, exercise_key, patient):
+    angles, counted = track_angles(data, exercise_key)
+    return save_session(
+        {
+            "patient_id": patient["patient_id"],
+            "patient_name": patient["patient_name"],
+            "exercise_key": exercise_key,
+            "source": "video",
+            "video_id": data["video_id"],
+            "started_at": datetime.utcnow(),
+            "duration": stats["duration"],
+            "reps": stats["reps"],
+            "assigned_reps": patient["assigned_reps"],
+            "sets": patient["sets"],
+            "avg_time": stats["avg_time"],
+            "form_score": stats["form_score"],
+        },
+        data["timestamps"],
+        angles,
+        counted,
+    )
 
-    remarks.append(
-        "Continued focus on pain-free range of motion and gradual progression is advised."
+# ================= VIDEO JOBS =================
+# Jobs wait for a video_executor slot rather than getting 503, so queued
+# jobs and direct uploads share the same workers and limits
+def run_video_job(job, progress):
+    stats = video_executor.run_blocking(
+        process_video,
+        job["video_id"],
+        job["input_path"],
+        job["content_hash"],
+        job["exercise_key"],
+        job["params"],
+        job["params"].get("sample_stride", 1),
+        job["params"].get("model_tier", VIDEO_MODEL_TIER),
+        progress,
     )
+    return video_response(stats, job["exercise_key"], job["params"])
+
+video_jobs = JobQueue(run_video_job)
 
-    return " ".join(remarks)
+def job_response(job):
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+    }
 
-def calculate_form_score(exercise, angle):
-    ideal_ranges = {
-        "bicep_curl": (30, 160),
-        "squat": (70, 160),
-        "shoulder_abduction": (70, 160),
-        "knee_extension": (0, 160),
-        "leg_raise": (40, 150),
-        "side_bend": (10, 35),
+# Accepts the upload and returns at once; poll GET /jobs/{job_id} for the result
+@app.post("/jobs/analyze_video", status_code=202)
+async def submit_video_job(
+    file: UploadFile = File(...),
+    exercise_key: str = Form(...),
+    patient_name: str = Form("Somay Singh"),
+    patient_id: str = Form("P-2025-001"),
+    assigned_reps: int = Form(10),
+    sets: int = Form(1),
+    adaptive_sampling: bool = Form(False),
+    model_tier: Literal["lite", "full", "heavy"] = Form(VIDEO_MODEL_TIER),
+):
+    video_id, input_path, content_hash = await receive_video(file)
+    params = {
+        "patient_name": patient_name,
+        "patient_id": patient_id,
+        "assigned_reps": assigned_reps,
+        "sets": sets,
+        "sample_stride": SAMPLE_STRIDE if adaptive_sampling else 1,
+        "model_tier": video_tiers.cap(model_tier),
     }
+    dedup_key = cache_key(content_hash, {
+        "exercise_key": exercise_key,
+        "pose": POSE_PARAMS,
+        **params,
+    })
 
-    low, high = ideal_ranges.get(exercise, (60, 150))
+    try:
+        job, created = video_jobs.submit(
+            dedup_key,
+            video_id=video_id,
+            input_path=input_path,
+            content_hash=content_hash,
+            exercise_key=exercise_key,
+            params=params,
+        )
+    except BaseException:
+        os.remove(input_path)
+        raise
+    if not created:
+        # Retry of a job we already have; the new copy is not needed
+        os.remove(input_path)
+
+    return job_response(job)
+
+@app.get("/jobs/{job_id}")
+def get_video_job(job_id: str):
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+# Re-score a stored landmark track without running pose inference again
+@app.post("/rescore_video")
+def rescore_video(req: RescoreRequest):
+    path = track_path(VIDEO_DIR, os.path.basename(req.video_id))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Landmark track not found")
+
+    overrides = {
+        key: value
+        for key, value in (("extended", req.extended), ("flexed", req.flexed))
+        if value is not None
+    }
+    stats = analyze_track(load_track(path), req.exercise_key, overrides)
 
-    if angle < low:
-        diff = low - angle
-    elif angle > high:
-        diff = angle - high
-    else:
-        diff = 0
+    return {
+        "video_id": req.video_id,
+        "exercise_key": req.exercise_key,
+        **stats,
+    }
 
-    score = max(0.0, 1.0 - diff / 60)
-    return score * 100
+# Overlay videos are drawn from the stored track the first time they are
+# fetched, then served from disk
+def overlay_path(video_id, exercise_key):
+    return os.path.join(OVERLAY_DIR, f"{video_id}_{exercise_key}.mp4")
+
+def build_overlay(video_id, exercise_key):
+    output_path = overlay_path(video_id, exercise_key)
+    if os.path.exists(output_path):
+        return output_path
+
+    path = track_path(VIDEO_DIR, video_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Landmark track not found")
+
+    data = load_track(path)
+    render_overlay(
+        os.path.join(VIDEO_DIR, data["video_file"]),
+        output_path,
+        data,
+        exercise_key,
+    )
+    return output_path
+
+# Renders in progress by (video_id, exercise_key). Players send several
+# range requests at once; they all wait on one render instead of each
+# taking a video_executor slot.
+overlay_renders = {}
+
+async def render_overlay_once(video_id, exercise_key):
+    key = (video_id, exercise_key)
+    task = overlay_renders.get(key)
+    if task is None:
+        task = asyncio.ensure_future(video_executor.run(build_overlay, video_id, exercise_key))
+        overlay_renders[key] = task
+        task.add_done_callback(lambda _: overlay_renders.pop(key, None))
+    # A client that disconnects must not cancel the render for the others
+    return await asyncio.shield(task)
+
+@app.get("/processed_videos/{video_id}/{exercise_key}.mp4")
+async def get_processed_video(video_id: str, exercise_key: str):
+    if exercise_key not in REP_RULES:
+        raise HTTPException(status_code=404, detail="Unknown exercise")
+
+    video_id = os.path.basename(video_id)
+    output_path = overlay_path(video_id, exercise_key)
+    if not os.path.exists(output_path):
+        output_path = await render_overlay_once(video_id, exercise_key)
+    return FileResponse(output_path, media_type="video/mp4")
 
+# ================= PDF REPORT =================
+async def in_report_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(report_pool(), fn, *args)
+
+# Which cached assets a payload gets: a stored session's, live or video,
+# from its angle series, else an unstored video's from its landmark track
+def asset_source(payload):
+    if payload["session_id"]:
+        if payload["exercise_key"] in REP_RULES:
+            return ("session", payload["session_id"])
+        return None
+    if payload["video_id"]:
+        return ("video", payload["video_id"], payload["exercise_key"])
+    return None
+
+# Adds the rep breakdown and angle chart of each session or video a
+# payload names. Those are built once and cached, so reports only embed them.
+async def attach_session_assets(payloads, run):
+    sources = list({asset_source(payload) for payload in payloads} - {None})
+    try:
+        assets = await asyncio.gather(*(run(report_assets, VIDEO_DIR, CHART_DIR, source) for source in sources))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Session data not found")
+
+    assets = dict(zip(sources, assets))
+    return [
+        {**payload, **assets[asset_source(payload)]}
+        if asset_source(payload) else payload
+        for payload in payloads
+    ]
+
+# Bodies naming a stored session_id get that session's numbers; fields
+# sent in the body still win
+def with_stored_sessions(bodies):
+    session_ids = [data["session_id"] for data in bodies if data.get("session_id")]
+    if not session_ids:
+        return bodies
+
+    stored = stored_report_fields(session_ids)
+    missing = set(session_ids) - set(stored)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Session not found: {sorted(missing)[0]}")
+    return [
+        {**stored[data["session_id"]], **data} if data.get("session_id") else data
+        for data in bodies
+    ]
+
+# Accept: application/pdf returns the document itself instead of a URL.
+# ETag is the payload hash, so a client holding the same report gets 304.
 @app.post("/generate_report")
-async def generate_report(request: Request):
+async def generate_report(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    archive: bool = REPORT_ARCHIVE,
+):
     try:
         data = await request.json()
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
 
-    patient_name = data.get("patient_name", "Unknown Patient")
-    patient_id = data.get("patient_id", "N/A")
-    exercise = data.get("exercise", "Exercise")
-
-    reps = int(data.get("reps", 0) or 0)
-    sets = int(data.get("sets", 1) or 1)
-    assigned_reps = int(data.get("assigned_reps", 0) or 0)
-    duration = float(data.get("duration", 0.0) or 0.0)
-    avg_time = float(data.get("avg_time", 0.0) or 0.0)
+    [data] = await report_executor.run(with_stored_sessions, [data])
+    try:
+        payload = normalize_report_payload(data)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid report values")
 
-    form_score = float(data.get("form_score", 0.0) or 0.0)
-    if form_score <= 1.0:
-        form_score *= 100.0
+    # Identical payloads render identical PDFs; reuse the one on disk
+    key = report_key(payload)
+    filename = report_filename(payload, key)
+    filepath = os.path.join(REPORT_DIR, filename)
+    cached = os.path.exists(filepath)
 
-    medical_history = data.get(
-        "medical_history",
-        "History of hip replacement surgery. Currently undergoing physiotherapy "
-        "for post-surgical strength, mobility, and functional recovery."
-    )
+    if PDF not in request.headers.get("accept", ""):
+        if not cached:
+            [payload] = await attach_session_assets([payload], report_executor.run)
+            await report_executor.run(write_report, payload, filepath)
+        return {"url": f"/reports/{filename}", "cached": cached}
 
-    primary_goal = data.get(
-        "goal",
-        "Improve strength, balance, and range of motion."
-    )
+    headers = {
+        "ETag": f'"{key}"',
+        "Content-Disposition": f'inline; filename="{filename}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers={"ETag": headers["ETag"]})
+    if cached:
+        return FileResponse(filepath, media_type=PDF, headers=headers)
+
+    [payload] = await attach_session_assets([payload], report_executor.run)
+    content = await report_executor.run(render_report, payload)
+    if archive:
+        # Written after the response is sent; the client never waits on disk
+        background_tasks.add_task(save_report, content, filepath)
+    return Response(content, media_type=PDF, headers=headers)
+
+# Reports rendered in worker processes, added to the archive in the order
+# they finish; the archive is yielded piece by piece as it grows
+async def stream_report_zip(reports):
+    async def rendered(filename, payload):
+        return filename, await in_report_pool(render_report, payload)
+
+    tasks = [asyncio.ensure_future(rendered(name, payload)) for name, payload in reports.items()]
+    sink = ZipChunks()
+    try:
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+            for task in asyncio.as_completed(tasks):
+                filename, content = await task
+                archive.writestr(filename, content)
+                yield sink.take()
+        yield sink.take()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+@app.post("/generate_reports")
+async def generate_reports(req: BatchReportRequest):
+    if not req.reports:
+        raise HTTPException(status_code=400, detail="No reports requested")
+    if len(req.reports) > REPORT_BATCH_MAX:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {REPORT_BATCH_MAX} reports per request",
+        )
 
-    date_str = datetime.now().strftime("%d %B %Y")
+    bodies = await report_executor.run(with_stored_sessions, req.reports)
+    try:
+        payloads = [normalize_report_payload(data) for data in bodies]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid report values")
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if req.output == "pdf":
+        payloads = await attach_session_assets(payloads, in_report_pool)
+        content = await in_report_pool(render_combined_report, payloads)
+        return Response(
+            content,
+            media_type=PDF,
+            headers={"Content-Disposition": f'attachment; filename="reports_{stamp}.pdf"'},
+        )
 
-    def make_bar(value, target, length=18):
-        if target <= 0:
-            return "[" + "-" * length + "]"
-        ratio = max(0.0, min(1.0, value / target))
-        filled = int(ratio * length)
-        return "[" + "#" * filled + "-" * (length - filled) + "]"
+    # Duplicate payloads share a file and are rendered once
+    filenames = [report_filename(payload, report_key(payload)) for payload in payloads]
+    reports = dict(zip(filenames, payloads))
 
-    if reps < 5:
-        reps_interp = "Low volume session"
-    elif reps < 15:
-        reps_interp = "Moderate volume session"
-    else:
-        reps_interp = "High volume session"
+    if req.output == "zip":
+        rendered = await attach_session_assets(list(reports.values()), in_report_pool)
+        return StreamingResponse(
+            stream_report_zip(dict(zip(reports, rendered))),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="reports_{stamp}.zip"'},
+        )
 
-    if duration < 20:
-        duration_interp = "Short session"
-    elif duration < 60:
-        duration_interp = "Typical session duration"
-    else:
-        duration_interp = "Extended session"
+    missing = [
+        filename for filename in reports
+        if not os.path.exists(os.path.join(REPORT_DIR, filename))
+    ]
+    rendered = await attach_session_assets([reports[filename] for filename in missing], in_report_pool)
+    await asyncio.gather(*(
+        in_report_pool(write_report, payload, os.path.join(REPORT_DIR, filename))
+        for filename, payload in zip(missing, rendered)
+    ))
 
-    if avg_time < 3:
-        speed_interp = "Slow and controlled"
-    elif avg_time < 7:
-        speed_interp = "Moderate tempo"
-    else:
-        speed_interp = "Fast-paced reps"
-
-    if form_score >= 85:
-        form_interp = "Excellent technique"
-    elif form_score >= 70:
-        form_interp = "Good technique"
-    else:
-        form_interp = "Technique needs improvement"
-
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 16)
-    pdf.cell(0, 10, "Physiotherapy Exercise Session Report - TherapEase", ln=1, align="C")
-
-    pdf.ln(4)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Patient Details", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.cell(0, 6, f"Name: {patient_name}", ln=1)
-    pdf.cell(0, 6, f"Patient ID: {patient_id}", ln=1)
-    pdf.cell(0, 6, f"Date of Report: {date_str}", ln=1)
-
-    pdf.ln(4)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Medical History", ln=1)
-    pdf.set_font("Helvetica", "", 11)
-    pdf.multi_cell(0, 5, medical_history)
-
-    pdf.ln(4)
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Current Prescription", ln=1)
-    pdf.set_font("Helvetica", "", 11)
-    pdf.multi_cell(0, 5, primary_goal)
-
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Session Summary", ln=1)
-
-    pdf.set_font("Helvetica", "B", 11)
-    pdf.cell(60, 7, "Metric", border=1)
-    pdf.cell(60, 7, "Result", border=1)
-    pdf.cell(70, 7, "Interpretation", border=1, ln=1)
-
-    pdf.set_font("Helvetica", "", 10)
-    pdf.cell(60, 7, "Exercise", border=1)
-    pdf.cell(60, 7, exercise, border=1)
-    pdf.cell(70, 7, "Primary movement", border=1, ln=1)
-
-    pdf.cell(60, 7, "Repetitions", border=1)
-    pdf.cell(60, 7, f"{reps} / {assigned_reps}", border=1)
-    pdf.cell(70, 7, reps_interp, border=1, ln=1)
-
-    pdf.cell(60, 7, "Session Duration", border=1)
-    pdf.cell(60, 7, f"{duration:.1f} sec", border=1)
-    pdf.cell(70, 7, duration_interp, border=1, ln=1)
-
-    pdf.cell(60, 7, "Average Speed", border=1)
-    pdf.cell(60, 7, f"{avg_time:.2f}", border=1)
-    pdf.cell(70, 7, speed_interp, border=1, ln=1)
-
-    pdf.cell(60, 7, "Form Score", border=1)
-    pdf.cell(60, 7, f"{form_score:.1f} / 100", border=1)
-    pdf.cell(70, 7, form_interp, border=1, ln=1)
-
-    pdf.add_page()
-    pdf.set_font("Helvetica", "B", 12)
-    pdf.cell(0, 8, "Therapist Remarks", ln=1)
-
-    pdf.set_font("Helvetica", "", 11)
-    pdf.multi_cell(
-        0,
-        5,
-        "Patient tolerated the session well. Continued focus on controlled, "
-        "pain-free movement and proper alignment is advised."
-    )
+    return {
+        "reports": [
+            {
+                "patient_id": payload["patient_id"],
+                "url": f"/reports/{filename}",
+                "cached": filename not in missing,
+            }
+            for filename, payload in zip(filenames, payloads)
+        ],
+        "rendered": len(missing),
+    }
 
-    filename = f"report_{patient_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    filepath = os.path.join(REPORT_DIR, filename)
-    pdf.output(filepath)
+# ================= SESSION HISTORY =================
+@app.get("/patients/{patient_id}/sessions")
+def get_patient_sessions(
+    patient_id: str,
+    exercise_key: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    limit: int = HISTORY_LIMIT,
+    db: Session = Depends(get_db),
+):
+    sessions = session_history(db, patient_id, exercise_key, since, until, max(1, limit))
+    return {
+        "patient_id": patient_id,
+        "sessions": [session_to_dict(session) for session in sessions],
+    }
 
-    return {"url": f"/reports/{filename}"}
+# Daily totals and averages per exercise, for progress charts
+@app.get("/patients/{patient_id}/progress")
+def get_patient_progress(
+    patient_id: str,
+    exercise_key: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: Session = Depends(get_db),
+):
+    return {
+        "patient_id": patient_id,
+        "days": session_progress(db, patient_id, exercise_key, since, until),
+    }
 
-@app.get("/reports/{filename}")
-def get_report(filename: str):
-    return FileResponse(
-        os.path.join(REPORT_DIR, filename),
-        media_type="application/pdf",
-    )
+# series=true adds the stored joint angle per frame
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str, series: bool = False, db: Session = Depends(get_db)):
+    detail = session_detail(db, session_id, series)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return detail
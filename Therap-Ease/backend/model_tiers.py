@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+
+# ================= MODEL TIERS =================
+# MediaPipe Pose model_complexity per tier, cheapest first
+MODEL_TIERS = {"lite": 0, "full": 1, "heavy": 2}
+TIER_NAMES = list(MODEL_TIERS)
+
+LIVE_MODEL_TIER = os.environ.get("LIVE_MODEL_TIER", "lite")
+VIDEO_MODEL_TIER = os.environ.get("VIDEO_MODEL_TIER", "full")
+
+# Queue wait (seconds) above which new work is stepped down a tier; load
+# is considered gone once the wait falls below target * TIER_RECOVER_RATIO
+LIVE_LATENCY_TARGET = float(os.environ.get("LIVE_LATENCY_TARGET", 0.15))
+VIDEO_LATENCY_TARGET = float(os.environ.get("VIDEO_LATENCY_TARGET", 20))
+TIER_RECOVER_RATIO = 0.3
+TIER_COOLDOWN = 5.0  # seconds between tier changes, so the cap does not flap
+
+
+# Caps the tier requests may use, based on how long an executor's tasks
+# wait for a worker. Steps one tier at a time in either direction.
+class TierController:
+    def __init__(self, executor, target, cooldown=TIER_COOLDOWN):
+        self.executor = executor
+        self.target = target
+        self.cooldown = cooldown
+        self.level = len(TIER_NAMES) - 1
+        self.changed_at = 0.0
+        self._lock = threading.Lock()
+
+    def cap(self, requested):
+        self._adjust()
+        return TIER_NAMES[min(TIER_NAMES.index(requested), self.level)]
+
+    def _adjust(self):
+        now = time.monotonic()
+        latency = self.executor.queue_latency()
+
+        with self._lock:
+            if now - self.changed_at < self.cooldown:
+                return
+            if latency > self.target and self.level > 0:
+                self.level -= 1
+                self.changed_at = now
+            elif latency < self.target * TIER_RECOVER_RATIO and self.level < len(TIER_NAMES) - 1:
+                self.level += 1
+                self.changed_at = now
+
+    def stats(self):
+        return {
+            "max_tier": TIER_NAMES[self.level],
+            "target": self.target,
+            "queue_latency": self.executor.queue_latency(),
+        }
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, LargeBinary, ForeignKey, Index
 from .database import Base
 
 class User(Base):
@@ -9,3 +11,72 @@ class User(Base):
     password = Column(String, nullable=False)
     dob = Column(String, nullable=False)
     role = Column(String, nullable=False)  # patient / doctor
+
+class VideoJob(Base):
+    __tablename__ = "video_jobs"
+
+    id = Column(String, primary_key=True)
+    # Same upload bytes + same analysis inputs => same job
+    dedup_key = Column(String, index=True, nullable=False)
+    status = Column(String, index=True, nullable=False)  # queued / running / done / failed
+    progress = Column(Float, nullable=False, default=0.0)
+    video_id = Column(String, nullable=False)
+    input_path = Column(String, nullable=False)
+    content_hash = Column(String, nullable=False)
+    exercise_key = Column(String, nullable=False)
+    params = Column(Text, nullable=False)  # JSON: patient and prescription fields
+    result = Column(Text)                  # JSON response once done
+    error = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class WorkoutSession(Base):
+    __tablename__ = "workout_sessions"
+
+    id = Column(String, primary_key=True)
+    patient_id = Column(String, nullable=False)
+    patient_name = Column(String)
+    exercise_key = Column(String, nullable=False)
+    source = Column(String, nullable=False)  # video / live
+    video_id = Column(String)                # analysed upload, for video sessions
+    started_at = Column(DateTime, nullable=False)
+    duration = Column(Float, nullable=False, default=0.0)
+    reps = Column(Integer, nullable=False, default=0)
+    assigned_reps = Column(Integer)
+    sets = Column(Integer)
+    avg_time = Column(Float, nullable=False, default=0.0)
+    form_score = Column(Float)  # 0..1, as in the analysis responses
+    range_of_motion = Column(Float)  # mean over the session's reps, degrees
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # History and progress queries: one patient, newest first, maybe one exercise
+        Index("ix_workout_sessions_patient_started", "patient_id", "started_at"),
+        Index("ix_workout_sessions_patient_exercise_started", "patient_id", "exercise_key", "started_at"),
+        # Clinic-wide views for a day
+        Index("ix_workout_sessions_started", "started_at"),
+        Index("ix_workout_sessions_video", "video_id", "exercise_key"),
+    )
+
+class Rep(Base):
+    __tablename__ = "reps"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, ForeignKey("workout_sessions.id", ondelete="CASCADE"), index=True, nullable=False)
+    number = Column(Integer, nullable=False)
+    time = Column(Float, nullable=False)  # seconds into the session the rep was counted
+    min_angle = Column(Float, nullable=False)
+    max_angle = Column(Float, nullable=False)
+    range_of_motion = Column(Float, nullable=False)
+    tempo = Column(Float, nullable=False)
+    form_score = Column(Float, nullable=False)  # 0..100
+
+# Whole-session joint angle series, one row per session: each column is a
+# little-endian float32 array with one value per frame (NaN without a pose)
+class AngleSeries(Base):
+    __tablename__ = "angle_series"
+
+    session_id = Column(String, ForeignKey("workout_sessions.id", ondelete="CASCADE"), primary_key=True)
+    frames = Column(Integer, nullable=False)
+    timestamps = Column(LargeBinary, nullable=False)
+    angles = Column(LargeBinary, nullable=False)
@@ -0,0 +1,58 @@
+import os
+
+import cv2
+import numpy as np
+
+# ================= MOTION GATE =================
+MOTION_GATE_ENABLED = os.environ.get("MOTION_GATE", "1") != "0"
+MOTION_THUMB_SIZE = 32    # frames are compared as 32x32 grayscale thumbnails
+MOTION_THRESHOLD = 3.0    # mean absolute grey-level difference that counts as movement
+MOTION_MAX_GATED = 15     # consecutive skipped frames before inferring anyway
+MOTION_MAX_GATED_EMPTY = 3  # same, when the last inference found nobody
+
+
+# Skips pose inference while the camera image has not changed since the
+# last inferred frame, e.g. while the patient rests between sets.
+class MotionGate:
+    def __init__(self):
+        self.reference = None
+        self.thumb = np.empty((MOTION_THUMB_SIZE, MOTION_THUMB_SIZE), np.uint8)
+        self.small = np.empty((MOTION_THUMB_SIZE, MOTION_THUMB_SIZE, 3), np.uint8)
+        self.run = 0
+        self.gated = 0
+        self.inferred = 0
+
+    # True when frame can reuse the last result; otherwise it becomes the
+    # new reference and the caller must run inference. A missed detection
+    # is retried sooner than a found pose is refreshed.
+    def still(self, frame, have_pose=True):
+        if not MOTION_GATE_ENABLED:
+            self.inferred += 1
+            return False
+
+        cv2.resize(
+            frame,
+            (MOTION_THUMB_SIZE, MOTION_THUMB_SIZE),
+            dst=self.small,
+            interpolation=cv2.INTER_AREA,
+        )
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.thumb)
+
+        max_gated = MOTION_MAX_GATED if have_pose else MOTION_MAX_GATED_EMPTY
+        if self.reference is not None and self.run < max_gated:
+            diff = cv2.norm(self.thumb, self.reference, cv2.NORM_L1) / self.thumb.size
+            if diff < MOTION_THRESHOLD:
+                self.run += 1
+                self.gated += 1
+                return True
+
+        # Keep this thumbnail as the reference; the old one becomes scratch
+        if self.reference is None:
+            self.reference = np.empty_like(self.thumb)
+        self.reference, self.thumb = self.thumb, self.reference
+        self.run = 0
+        self.inferred += 1
+        return False
+
+    def stats(self):
+        return {"inferred": self.inferred, "gated": self.gated}
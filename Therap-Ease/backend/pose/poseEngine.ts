@@ -9,6 +9,83 @@ export type PoseFrame = {
   keypoints: Keypoint[];
 };
 
+// Rep state computed by the server (backend/rep_counter.py)
+export type ServerRepState = {
+  reps: number;
+  stage: "up" | "down" | null;
+  angle: number | null;
+  rep_detected: boolean;
+  active_side: "left" | "right" | null;
+  form_score: number | null;
+};
+
+// Name table from GET /keypoint_schema, used to expand compact responses
+export type KeypointSchema = {
+  names: string[];
+  exercises: Record<string, number[]>;
+  default: number[];
+};
+
+// Compact keypoints are a flat [x, y, score, ...] list in schema order
+export function expandKeypoints(
+  flat: number[],
+  schema: KeypointSchema,
+  exercise: string
+): Keypoint[] {
+  const indices = schema.exercises[exercise] ?? schema.default;
+  const keypoints: Keypoint[] = [];
+  for (let i = 0; i < indices.length && i * 3 < flat.length; i++) {
+    keypoints.push({
+      name: schema.names[indices[i]],
+      x: flat[i * 3],
+      y: flat[i * 3 + 1],
+      score: flat[i * 3 + 2],
+    });
+  }
+  return keypoints;
+}
+
+// application/octet-stream frames from /analyze_frame; layout matches
+// PACKED_HEADER in backend/keypoints.py
+const PACKED_HEADER_BYTES = 16;
+const STAGES = ["up", "down"] as const;
+const SIDES = ["left", "right"] as const;
+const TIERS = ["lite", "full", "heavy"] as const;
+
+export function decodePackedFrame(
+  buffer: ArrayBuffer,
+  schema: KeypointSchema & { version: number },
+  exercise: string
+): {
+  keypoints: Keypoint[];
+  reps: ServerRepState;
+  modelTier: (typeof TIERS)[number];
+} | null {
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== schema.version) return null;
+
+  const flags = view.getUint8(1);
+  const count = view.getUint16(2, true);
+  const stage = view.getInt8(6);
+  const side = view.getInt8(7);
+  const angle = view.getFloat32(8, true);
+  const formScore = view.getFloat32(12, true);
+  const values = new Float32Array(buffer, PACKED_HEADER_BYTES, count * 3);
+
+  return {
+    keypoints: expandKeypoints(Array.from(values), schema, exercise),
+    reps: {
+      reps: view.getUint16(4, true),
+      stage: stage >= 0 ? STAGES[stage] : null,
+      angle: Number.isNaN(angle) ? null : angle,
+      rep_detected: (flags & 1) === 1,
+      active_side: side >= 0 ? SIDES[side] : null,
+      form_score: Number.isNaN(formScore) ? null : formScore,
+    },
+    modelTier: TIERS[(flags >> 1) & 3],
+  };
+}
+
 export type PoseResult = {
   angle: number;
   stage: "up" | "down" | "-";
@@ -27,6 +104,17 @@ const angle3 = (a: Keypoint, b: Keypoint, c: Keypoint) => {
   return deg;
 };
 
+export function fromServerState(state: ServerRepState): PoseResult {
+  return {
+    angle: state.angle ?? 0,
+    stage: state.stage ?? "-",
+    repDetected: state.rep_detected,
+    activeSide: state.active_side,
+  };
+}
+
+// Local fallback for servers that do not send rep state; thresholds must
+// match REP_RULES in backend/rep_counter.py
 export function processPose(
   exercise: string,
   pose: PoseFrame,
@@ -49,7 +137,7 @@ export function processPose(
     angle = angle3(h, k, a);
 
     if (angle > 160) stage = "up";
-    if (angle < 95 && prevStage === "up") {
+    if (angle < 100 && prevStage === "up") {
       stage = "down";
       repDetected = true;
     }
@@ -0,0 +1,279 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import mediapipe as mp
+from fastapi import HTTPException
+
+from .rep_counter import RepCounter
+from .smoothing import OneEuroFilter, SMOOTHING_ENABLED
+from .model_tiers import MODEL_TIERS, LIVE_MODEL_TIER
+from .roi import RoiTracker
+from .motion_gate import MotionGate
+from .session_store import SessionRecording
+
+mp_pose = mp.solutions.pose
+
+# ================= POOL LIMITS =================
+# Active sessions are never evicted to make room; new ones get 503 instead
+POOL_MAX_SESSIONS = int(os.environ.get("POOL_MAX_SESSIONS", 64))
+POOL_IDLE_TIMEOUT = 120  # seconds without a frame before a session is dropped
+POOL_SWEEP_INTERVAL = 30  # seconds between idle checks when no frames arrive
+POOL_WARM_SIZE = 4       # detectors built at startup, handed to new sessions
+SPARE_TIER = "lite"      # tier of the warm spares
+
+
+def create_detector(model_complexity=0):
+    return mp_pose.Pose(
+        static_image_mode=False,
+        model_complexity=model_complexity,
+        enable_segmentation=False,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5,
+    )
+
+
+class PoseSession:
+    def __init__(self, session_id, detector, tier=SPARE_TIER):
+        self.session_id = session_id
+        self.detector = detector
+        self.tier = tier
+        # MediaPipe graphs are not thread-safe; process() holds this
+        self.lock = threading.Lock()
+        # Held for a whole frame in process_frame: the gate, ROI tracker and
+        # per-frame state below are only touched under it, so two requests
+        # for one session run one after the other
+        self.frame_lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+        self.counter = None
+        self.smoother = OneEuroFilter()
+        # JPEG decode scale for this camera, see frame_arena.decode_reduction
+        self.decode_reduction = 1
+        self.roi = RoiTracker()
+        self.gate = MotionGate()
+        self.last_landmarks = None  # reused for frames the gate skips
+        # Set by the client; sessions without one are not stored
+        self.patient_id = None
+        self.recording = None
+        self.recordings = []  # one per exercise, finished ones first
+
+    def process(self, rgb):
+        with self.lock:
+            if self.closed:
+                # Evicted while this frame was queued; treat as no detection
+                return None
+            return self.detector.process(rgb)
+
+    # MediaPipe tracks in image coordinates; call when the image space moves
+    def reset_tracking(self):
+        with self.lock:
+            if not self.closed:
+                self.detector.reset()
+
+    # Jitter-free landmarks for both rep counting and the keypoints sent back
+    def smooth(self, landmarks, t):
+        if not SMOOTHING_ENABLED:
+            return landmarks
+        with self.lock:
+            return self.smoother(landmarks, t)
+
+    def count_reps(self, exercise_key, landmarks, t):
+        with self.lock:
+            self._ensure_counter(exercise_key)
+            if landmarks is None:
+                self.counter.rep_detected = False
+                return self.counter.state()
+
+            state = self.counter.update(landmarks, t)
+            if state["angle"] is not None:
+                self.recording.add(t, state["angle"], state["rep_detected"])
+            return state
+
+    def _ensure_counter(self, exercise_key):
+        # Switching exercise mid-session starts a fresh count
+        if self.counter is None or self.counter.exercise_key != exercise_key:
+            self._finish_recording()
+            self.counter = RepCounter(exercise_key)
+            self.recording = SessionRecording(exercise_key)
+            self.recordings.append(self.recording)
+
+    def _finish_recording(self):
+        if self.recording is not None:
+            self.recording.summary = self.counter.summary()
+
+    # Swaps in a detector of another tier; tracking restarts on the next frame
+    def use_tier(self, tier):
+        if tier == self.tier:
+            return
+
+        detector = create_detector(MODEL_TIERS[tier])
+        with self.lock:
+            if self.closed:
+                old = detector
+            else:
+                old, self.detector, self.tier = self.detector, detector, tier
+        old.close()
+
+    # True only for the call that actually closed the session
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return False
+            self.closed = True
+            self.detector.close()
+            self._finish_recording()
+            return True
+
+
+class PosePool:
+    def __init__(
+        self,
+        max_sessions=POOL_MAX_SESSIONS,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        warm_size=POOL_WARM_SIZE,
+        on_close=None,
+    ):
+        # on_close(session) runs once per session after it is closed,
+        # whether released, evicted or shut down
+        self.on_close = on_close
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.warm_size = warm_size
+        self._sessions = OrderedDict()
+        self._spares = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sweeper = None
+
+    def warm(self):
+        spares = [create_detector(MODEL_TIERS[SPARE_TIER]) for _ in range(self.warm_size)]
+        with self._lock:
+            self._spares.extend(spares)
+
+    # Closes idle sessions on a timer, so a client that vanishes without
+    # releasing its session is still stored once it times out
+    def start_sweeper(self, interval=POOL_SWEEP_INTERVAL):
+        self._stop.clear()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop,
+            args=(interval,),
+            name="pose-pool-sweeper",
+            daemon=True,
+        )
+        self._sweeper.start()
+
+    def _sweep_loop(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                # A session that failed to store must not stop later sweeps
+                pass
+
+    def sweep(self):
+        with self._lock:
+            expired = self._pop_idle(time.monotonic())
+        self._close_all(expired)
+
+    # tier: model tier the session should run at from this frame on
+    def get(self, session_id, tier=LIVE_MODEL_TIER):
+        now = time.monotonic()
+        expired = []
+        detector = None
+
+        with self._lock:
+            expired.extend(self._pop_idle(now))
+
+            session = self._sessions.get(session_id)
+            full = session is None and len(self._sessions) >= self.max_sessions
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.last_used = now
+            elif tier == SPARE_TIER and self._spares and not full:
+                detector = self._spares.pop()
+
+        if full:
+            self._close_all(expired)
+            raise self.pool_full()
+
+        if session is not None:
+            self._close_all(expired)
+            session.use_tier(tier)
+            return session
+
+        if detector is None:
+            detector = create_detector(MODEL_TIERS[tier])
+
+        with self._lock:
+            # Another request for the same id may have won the race
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+            elif len(self._sessions) < self.max_sessions:
+                session = PoseSession(session_id, detector, tier)
+                self._sessions[session_id] = session
+                detector = None
+
+        if detector is not None:
+            if tier == SPARE_TIER:
+                with self._lock:
+                    self._spares.append(detector)
+            else:
+                detector.close()
+
+        self._close_all(expired)
+        if session is None:
+            # Filled up while the detector was being built
+            raise self.pool_full()
+        session.use_tier(tier)
+        return session
+
+    @staticmethod
+    def pool_full():
+        return HTTPException(
+            status_code=503,
+            detail="Too many live sessions, retry shortly",
+            headers={"Retry-After": "5"},
+        )
+
+    def release(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._close_all([session])
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            spares = self._spares
+            self._sessions.clear()
+            self._spares = []
+
+        self._close_all(sessions)
+        for detector in spares:
+            detector.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "spares": len(self._spares),
+                "max_sessions": self.max_sessions,
+            }
+
+    def _pop_idle(self, now):
+        expired = []
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used < self.idle_timeout:
+                # OrderedDict is in LRU order, the rest are fresher
+                break
+            expired.append(self._sessions.pop(session_id))
+        return expired
+
+    def _close_all(self, sessions):
+        for session in sessions:
+            if session.close() and self.on_close is not None:
+                self.on_close(session)
@@ -0,0 +1,198 @@
+import numpy as np
+
+from .angles import joint_angles, joint_visibility, triplet_indices
+
+# ================= JOINT TRIPLETS (a, vertex, c) =================
+LEG_JOINTS = [
+    ("left_hip", "left_knee", "left_ankle"),
+    ("right_hip", "right_knee", "right_ankle"),
+]
+
+ARM_JOINTS = [
+    ("left_shoulder", "left_elbow", "left_wrist"),
+    ("right_shoulder", "right_elbow", "right_wrist"),
+]
+
+TRUNK_JOINTS = [
+    ("left_shoulder", "left_hip", "right_hip"),
+]
+
+# ================= REP RULES =================
+# A rep is counted when the angle drops below "flexed" after having been
+# above "extended". "combine" picks how several triplets become one angle:
+#   mean    - average of all triplets, one shared stage
+#   visible - the most visible triplet only, each side keeps its own stage
+# "stages" names the (extended, flexed) stage labels sent to clients.
+REP_RULES = {
+    "squat": {
+        "joints": LEG_JOINTS,
+        "combine": "mean",
+        "extended": 160,
+        "flexed": 100,
+        "stages": ("up", "down"),
+    },
+    "knee_extension": {
+        "joints": LEG_JOINTS,
+        "combine": "mean",
+        "extended": 160,
+        "flexed": 100,
+        "stages": ("up", "down"),
+    },
+    "leg_raise": {
+        "joints": LEG_JOINTS,
+        "combine": "mean",
+        "extended": 160,
+        "flexed": 100,
+        "stages": ("up", "down"),
+    },
+    "bicep_curl": {
+        "joints": ARM_JOINTS,
+        "combine": "visible",
+        "extended": 150,
+        "flexed": 50,
+        "stages": ("down", "up"),
+    },
+    "shoulder_abduction": {
+        "joints": ARM_JOINTS,
+        "combine": "visible",
+        "extended": 150,
+        "flexed": 50,
+        "stages": ("down", "up"),
+    },
+    "side_bend": {
+        "joints": TRUNK_JOINTS,
+        "combine": "mean",
+        "extended": 40,
+        "flexed": 25,
+        "stages": ("up", "down"),
+    },
+}
+
+# Landmark indices per exercise, shape (J, 3), built once at import
+EXERCISE_TRIPLETS = {
+    key: triplet_indices(rule["joints"]) for key, rule in REP_RULES.items()
+}
+
+IDEAL_RANGES = {
+    "bicep_curl": (30, 160),
+    "squat": (70, 160),
+    "shoulder_abduction": (70, 160),
+    "knee_extension": (0, 160),
+    "leg_raise": (40, 150),
+    "side_bend": (10, 35),
+}
+
+
+def calculate_form_score(exercise, angle):
+    low, high = IDEAL_RANGES.get(exercise, (60, 150))
+
+    if angle < low:
+        diff = low - angle
+    elif angle > high:
+        diff = angle - high
+    else:
+        diff = 0
+
+    score = max(0.0, 1.0 - diff / 60)
+    return score * 100
+
+
+def side_of(triplet):
+    return triplet[1].split("_")[0]
+
+
+class RepCounter:
+    # overrides: optional {"extended": ..., "flexed": ...} to re-score a track
+    def __init__(self, exercise_key, overrides=None):
+        self.exercise_key = exercise_key
+        self.rule = REP_RULES.get(exercise_key)
+        self.triplets = EXERCISE_TRIPLETS.get(exercise_key)
+        if self.rule and overrides:
+            self.rule = {**self.rule, **overrides}
+
+        self.reps = 0
+        self.stages = {}
+        self.angle = None
+        self.active = None
+        self.rep_detected = False
+        self.rep_times = []
+        self.scores = []
+        self.last_rep = None
+
+    # landmarks: (33, 4) array of x, y, z, visibility; t: seconds
+    def update(self, landmarks, t):
+        self.rep_detected = False
+        if self.triplets is None:
+            return self.state()
+
+        angle, active = self.combine(landmarks)
+        self.observe(float(angle), int(active), t)
+        return self.state()
+
+    # track: (T, 33, 4) with NaN rows where no pose was found
+    # timestamps: (T,) seconds
+    def run(self, track, timestamps):
+        if self.triplets is None:
+            return self.summary()
+
+        angles, active = self.combine(track)
+        for i in np.flatnonzero(~np.isnan(angles)):
+            self.rep_detected = False
+            self.observe(float(angles[i]), int(active[i]), float(timestamps[i]))
+        return self.summary()
+
+    # Works on one frame or a whole track; active is -1 when sides are averaged
+    def combine(self, landmarks):
+        angles = joint_angles(landmarks, self.triplets)
+        if self.rule["combine"] == "visible":
+            active = np.argmax(joint_visibility(landmarks, self.triplets), axis=-1)
+            angle = np.take_along_axis(angles, active[..., None], axis=-1)[..., 0]
+            return angle, active
+        return angles.mean(axis=-1), np.full(angles.shape[:-1], -1)
+
+    def observe(self, angle, active, t):
+        self.angle = angle
+        self.active = active if active >= 0 else None
+        stage_key = self.active if self.active is not None else 0
+        self.step(stage_key, angle, t)
+
+    def step(self, stage_key, angle, t):
+        extended_stage, flexed_stage = self.rule["stages"]
+        stage = self.stages.get(stage_key)
+
+        if angle > self.rule["extended"]:
+            self.stages[stage_key] = extended_stage
+        if angle < self.rule["flexed"] and stage == extended_stage:
+            self.stages[stage_key] = flexed_stage
+            self.reps += 1
+            self.rep_detected = True
+            self.scores.append(calculate_form_score(self.exercise_key, angle))
+            if self.last_rep is not None:
+                self.rep_times.append(t - self.last_rep)
+            self.last_rep = t
+
+    def state(self):
+        stage_key = self.active if self.active is not None else 0
+        form_score = None
+        if self.angle is not None:
+            form_score = calculate_form_score(self.exercise_key, self.angle) / 100.0
+
+        active_side = None
+        if self.active is not None:
+            active_side = side_of(self.rule["joints"][self.active])
+
+        return {
+            "reps": self.reps,
+            "stage": self.stages.get(stage_key),
+            "angle": self.angle,
+            "rep_detected": self.rep_detected,
+            "active_side": active_side,
+            "form_score": form_score,
+        }
+
+    def summary(self):
+        return {
+            "reps": self.reps,
+            "avg_time": float(np.mean(self.rep_times)) if self.rep_times else 0.0,
+            "form_score": float(np.mean(self.scores) / 100.0) if self.scores else 0.8,
+        }
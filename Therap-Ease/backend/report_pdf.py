@@ -0,0 +1,352 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from fpdf import FPDF
+from fpdf.enums import MethodReturnValue, XPos, YPos
+
+from .files import write_atomic
+from .rep_counter import REP_RULES
+
+# ================= REPORT TEMPLATE =================
+REPORT_TITLE = "Physiotherapy Exercise Session Report - TherapEase"
+DEFAULT_MEDICAL_HISTORY = (
+    "History of hip replacement surgery. Currently undergoing physiotherapy "
+    "for post-surgical strength, mobility, and functional recovery."
+)
+DEFAULT_GOAL = "Improve strength, balance, and range of motion."
+THERAPIST_REMARKS = (
+    "Patient tolerated the session well. Continued focus on controlled, "
+    "pain-free movement and proper alignment is advised."
+)
+
+BODY_FONT = ("Helvetica", "", 11)
+SUMMARY_COLUMNS = (60, 60, 70)
+REP_COLUMNS = (20, 45, 40, 40, 45)
+PARAGRAPH_LINE_HEIGHT = 5
+
+
+def generate_ai_physio_review(form_score, avg_time, reps, assigned_reps):
+    remarks = []
+
+    if form_score >= 85:
+        remarks.append(
+            "The patient demonstrated excellent movement quality with consistent joint alignment."
+        )
+    elif form_score >= 70:
+        remarks.append(
+            "Overall technique was good, though minor deviations were observed during certain repetitions."
+        )
+    else:
+        remarks.append(
+            "Movement quality was inconsistent, indicating the need for corrective supervision."
+        )
+
+    if avg_time < 3:
+        remarks.append(
+            "Repetitions were performed in a slow and controlled manner, appropriate for rehabilitation."
+        )
+    elif avg_time < 7:
+        remarks.append(
+            "Movement tempo was appropriate and well controlled."
+        )
+    else:
+        remarks.append(
+            "Repetitions were performed at a faster pace; controlled tempo is recommended."
+        )
+
+    if reps >= assigned_reps:
+        remarks.append(
+            "The prescribed exercise volume was successfully completed."
+        )
+    else:
+        remarks.append(
+            "The patient was unable to complete the prescribed volume, possibly due to fatigue."
+        )
+
+    remarks.append(
+        "Continued focus on pain-free range of motion and gradual progression is advised."
+    )
+
+    return " ".join(remarks)
+
+
+# ================= REPORT PAYLOAD =================
+# Everything the PDF depends on, with defaults filled in and numbers
+# coerced, so equal reports produce equal payloads
+def normalize_report_payload(data):
+    form_score = float(data.get("form_score", 0.0) or 0.0)
+    if form_score <= 1.0:
+        form_score *= 100.0
+
+    video_id = os.path.basename(str(data["video_id"])) if data.get("video_id") else None
+    exercise_key = data.get("exercise_key")
+    if video_id and exercise_key not in REP_RULES:
+        raise ValueError("video_id needs a known exercise_key")
+
+    return {
+        "patient_name": str(data.get("patient_name", "Unknown Patient")),
+        "patient_id": str(data.get("patient_id", "N/A")),
+        "exercise": str(data.get("exercise", "Exercise")),
+        "reps": int(data.get("reps", 0) or 0),
+        "sets": int(data.get("sets", 1) or 1),
+        "assigned_reps": int(data.get("assigned_reps", 0) or 0),
+        "duration": float(data.get("duration", 0.0) or 0.0),
+        "avg_time": float(data.get("avg_time", 0.0) or 0.0),
+        "form_score": form_score,
+        "medical_history": str(data.get("medical_history", DEFAULT_MEDICAL_HISTORY)),
+        "goal": str(data.get("goal", DEFAULT_GOAL)),
+        "date": datetime.now().strftime("%d %B %Y"),
+        # Stored session, or else analysed video, whose per-rep breakdown
+        # and angle chart to include
+        "session_id": str(data["session_id"]) if data.get("session_id") else None,
+        "video_id": video_id,
+        "exercise_key": exercise_key,
+    }
+
+
+PDF = "application/pdf"
+# Keep a copy of PDFs returned inline under REPORT_DIR unless asked not to
+REPORT_ARCHIVE = os.environ.get("REPORT_ARCHIVE", "1") != "0"
+
+
+def report_key(payload):
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+# The payload hash keeps names unique; the patient id only has to be
+# readable and safe to use in a path
+def report_filename(payload, key):
+    patient_id = re.sub(r"[^A-Za-z0-9_-]", "_", payload["patient_id"])[:40]
+    return f"report_{patient_id}_{key[:16]}.pdf"
+
+
+# ================= PDF RENDERING =================
+# Line breaking dominates render time, so paragraphs are broken once per
+# text and font on a document kept only for measuring. The template text
+# and default history/goal then cost one cell per line in every report.
+_measure_pdf = FPDF()
+_measure_pdf.add_page()
+_measure_lock = threading.Lock()
+
+
+@lru_cache(maxsize=256)
+def wrapped_lines(text, font):
+    with _measure_lock:
+        _measure_pdf.set_font(*font)
+        return tuple(_measure_pdf.multi_cell(
+            0,
+            PARAGRAPH_LINE_HEIGHT,
+            text,
+            dry_run=True,
+            output=MethodReturnValue.LINES,
+        ))
+
+
+def paragraph(pdf, text, font=BODY_FONT):
+    pdf.set_font(*font)
+    for line in wrapped_lines(text, font):
+        pdf.cell(0, PARAGRAPH_LINE_HEIGHT, line, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+def heading(pdf, text):
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 8, text, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+def table_row(pdf, cells, widths=SUMMARY_COLUMNS):
+    for width, text in zip(widths[:-1], cells):
+        pdf.cell(width, 7, text, border=1)
+    pdf.cell(widths[-1], 7, cells[-1], border=1, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+def interpretations(payload):
+    reps = payload["reps"]
+    duration = payload["duration"]
+    avg_time = payload["avg_time"]
+    form_score = payload["form_score"]
+
+    if reps < 5:
+        reps_interp = "Low volume session"
+    elif reps < 15:
+        reps_interp = "Moderate volume session"
+    else:
+        reps_interp = "High volume session"
+
+    if duration < 20:
+        duration_interp = "Short session"
+    elif duration < 60:
+        duration_interp = "Typical session duration"
+    else:
+        duration_interp = "Extended session"
+
+    if avg_time < 3:
+        speed_interp = "Slow and controlled"
+    elif avg_time < 7:
+        speed_interp = "Moderate tempo"
+    else:
+        speed_interp = "Fast-paced reps"
+
+    if form_score >= 85:
+        form_interp = "Excellent technique"
+    elif form_score >= 70:
+        form_interp = "Good technique"
+    else:
+        form_interp = "Technique needs improvement"
+
+    return reps_interp, duration_interp, speed_interp, form_interp
+
+
+def new_report_pdf():
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    return pdf
+
+
+# Appends one patient's three report pages to pdf
+def add_report_pages(pdf, payload):
+    reps_interp, duration_interp, speed_interp, form_interp = interpretations(payload)
+
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.cell(0, 10, REPORT_TITLE, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+
+    pdf.ln(4)
+    heading(pdf, "Patient Details")
+    pdf.set_font(*BODY_FONT)
+    pdf.cell(0, 6, f"Name: {payload['patient_name']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 6, f"Patient ID: {payload['patient_id']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 6, f"Date of Report: {payload['date']}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    pdf.ln(4)
+    heading(pdf, "Medical History")
+    paragraph(pdf, payload["medical_history"])
+
+    pdf.ln(4)
+    heading(pdf, "Current Prescription")
+    paragraph(pdf, payload["goal"])
+
+    pdf.add_page()
+    heading(pdf, "Session Summary")
+
+    pdf.set_font("Helvetica", "B", 11)
+    table_row(pdf, ("Metric", "Result", "Interpretation"))
+
+    pdf.set_font("Helvetica", "", 10)
+    table_row(pdf, ("Exercise", payload["exercise"], "Primary movement"))
+    table_row(pdf, ("Repetitions", f"{payload['reps']} / {payload['assigned_reps']}", reps_interp))
+    table_row(pdf, ("Session Duration", f"{payload['duration']:.1f} sec", duration_interp))
+    table_row(pdf, ("Average Speed", f"{payload['avg_time']:.2f}", speed_interp))
+    table_row(pdf, ("Form Score", f"{payload['form_score']:.1f} / 100", form_interp))
+
+    if payload.get("angle_chart"):
+        add_rep_pages(pdf, payload["rep_breakdown"], payload["angle_chart"])
+
+    pdf.add_page()
+    heading(pdf, "Therapist Remarks")
+    paragraph(pdf, THERAPIST_REMARKS)
+
+
+# rows and chart come from session_report_assets; the chart is a cached
+# PNG and is only embedded here, never redrawn
+def add_rep_pages(pdf, rows, chart):
+    pdf.add_page()
+    heading(pdf, "Repetition Breakdown")
+
+    pdf.set_font("Helvetica", "B", 11)
+    table_row(pdf, ("Rep", "Range of Motion", "Angles", "Tempo", "Form Score"), REP_COLUMNS)
+
+    pdf.set_font("Helvetica", "", 10)
+    for row in rows:
+        table_row(pdf, (
+            str(row["rep"]),
+            f"{row['range_of_motion']:.1f} deg",
+            f"{row['min_angle']:.0f} - {row['max_angle']:.0f}",
+            f"{row['tempo']:.2f} sec",
+            f"{row['form_score']:.1f} / 100",
+        ), REP_COLUMNS)
+    if not rows:
+        paragraph(pdf, "No complete repetitions were detected in the recording.")
+
+    pdf.ln(4)
+    heading(pdf, "Joint Angle Over Time")
+    pdf.image(chart, w=pdf.epw)
+
+
+# payload: from normalize_report_payload, plus rep_breakdown and
+# angle_chart when it names a video; returns the PDF file contents
+def render_report(payload):
+    pdf = new_report_pdf()
+    add_report_pages(pdf, payload)
+    return bytes(pdf.output())
+
+
+def save_report(content, filepath):
+    return write_atomic(filepath, content)
+
+
+def write_report(payload, filepath):
+    return save_report(render_report(payload), filepath)
+
+
+# ================= BATCH RENDERING =================
+REPORT_PROCESSES = int(os.environ.get("REPORT_PROCESSES", os.cpu_count() or 1))
+REPORT_BATCH_MAX = int(os.environ.get("REPORT_BATCH_MAX", 500))
+
+_report_pool = None
+_report_pool_lock = threading.Lock()
+
+
+def report_pool():
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is None:
+            _report_pool = ProcessPoolExecutor(
+                max_workers=REPORT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _report_pool
+
+
+def shutdown_report_pool():
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is not None:
+            _report_pool.shutdown(wait=False, cancel_futures=True)
+            _report_pool = None
+
+
+# Every payload's pages in one document, in request order. fpdf2 cannot
+# merge finished PDFs, so this one is built by a single worker.
+def render_combined_report(payloads):
+    pdf = new_report_pdf()
+    for payload in payloads:
+        add_report_pages(pdf, payload)
+    return bytes(pdf.output())
+
+
+# File-like sink for zipfile that hands back what was written so far, so
+# an archive can be streamed while later members are still rendering
+class ZipChunks(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
@@ -0,0 +1,110 @@
+import numpy as np
+
+from .landmarks import X, Y, Z, VISIBILITY
+
+# ================= PERSON ROI =================
+ROI_PADDING = 0.3          # added around the person's box, as a fraction of its size
+ROI_MIN_VISIBLE = 8        # landmarks needed to trust the box
+ROI_MIN_VISIBILITY = 0.5
+ROI_KEEP_MARGIN = 0.05     # person may move this close to the crop edge before re-centering
+ROI_MIN_FILL = 0.5         # re-crop once the person fills less than this of the crop
+ROI_MAX_SIDE = 0.9         # crops this close to the whole frame are not worth it
+ROI_RETRY_FRAMES = 30      # full-frame frames after a crop lost the patient
+
+
+# Square crop around the patient in full-frame pixels, kept steady between
+# frames so MediaPipe's own tracking sees a still image space. Re-centers
+# only when the patient nears the crop edge or shrinks inside it, and
+# drops back to the whole frame when the pose is lost.
+class RoiTracker:
+    def __init__(self):
+        self.box = None  # (x0, y0, side) in full-resolution pixels
+        self.region = None  # what the previous frame was inferred on
+        self.changed = False
+        self.cooldown = 0
+
+    def reset(self):
+        self.box = None
+
+    # Full-resolution pixel size of what will be inferred next
+    def size(self, full_w, full_h):
+        if self.box is None:
+            return full_w, full_h
+        return self.box[2], self.box[2]
+
+    # frame was decoded at 1/reduction of full resolution; returns the view
+    # to run inference on and its (x0, y0, w, h) in full-resolution pixels.
+    # Sets changed when that region differs from the previous frame's.
+    def crop(self, frame, reduction):
+        crop, region = self._crop(frame, reduction)
+        self.changed = self.region is not None and region != self.region
+        self.region = region
+        return crop, region
+
+    def _crop(self, frame, reduction):
+        h, w = frame.shape[:2]
+        if self.box is None:
+            return frame, (0, 0, w * reduction, h * reduction)
+
+        x0, y0, side = (int(v / reduction) for v in self.box)
+        x0, y0 = min(x0, w - side), min(y0, h - side)
+        if side > min(w, h) or side <= 0 or x0 < 0 or y0 < 0:
+            self.box = None
+            return frame, (0, 0, w * reduction, h * reduction)
+
+        region = (x0 * reduction, y0 * reduction, side * reduction, side * reduction)
+        return frame[y0:y0 + side, x0:x0 + side], region
+
+    # Maps crop-normalized landmarks back to full-frame normalized space
+    @staticmethod
+    def to_frame(landmarks, region, full_w, full_h):
+        x0, y0, w, h = region
+        mapped = landmarks.copy()
+        mapped[:, X] = (x0 + landmarks[:, X] * w) / full_w
+        mapped[:, Y] = (y0 + landmarks[:, Y] * h) / full_h
+        # z shares the x scale in MediaPipe's output
+        mapped[:, Z] = landmarks[:, Z] * w / full_w
+        return mapped
+
+    # landmarks: full-frame normalized (33, 4), or None when nothing was found
+    def update(self, landmarks, full_w, full_h):
+        if landmarks is None:
+            if self.box is not None:
+                # The crop lost the patient; stay on the full frame for a while
+                self.cooldown = ROI_RETRY_FRAMES
+            self.box = None
+            return
+        if self.cooldown:
+            self.cooldown -= 1
+            return
+
+        visible = landmarks[landmarks[:, VISIBILITY] >= ROI_MIN_VISIBILITY]
+        if len(visible) < ROI_MIN_VISIBLE:
+            self.box = None
+            return
+
+        xs = visible[:, X] * full_w
+        ys = visible[:, Y] * full_h
+        left, right = xs.min(), xs.max()
+        top, bottom = ys.min(), ys.max()
+        person = max(right - left, bottom - top)
+
+        if self.box is not None:
+            x0, y0, side = self.box
+            margin = side * ROI_KEEP_MARGIN
+            inside = (
+                left >= x0 + margin and right <= x0 + side - margin
+                and top >= y0 + margin and bottom <= y0 + side - margin
+            )
+            if inside and person >= side * ROI_MIN_FILL:
+                return
+
+        side = person * (1 + 2 * ROI_PADDING)
+        if side >= min(full_w, full_h) * ROI_MAX_SIDE:
+            self.box = None
+            return
+
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        x0 = int(np.clip(cx - side / 2, 0, full_w - side))
+        y0 = int(np.clip(cy - side / 2, 0, full_h - side))
+        self.box = (x0, y0, int(side))
@@ -0,0 +1,153 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from .files import write_atomic
+from .rep_counter import RepCounter, REP_RULES, calculate_form_score
+from .video_pipeline import load_track, smoothed_track, track_path
+
+# ================= PER-REP BREAKDOWN =================
+# Runs the rep counter over a whole angle series and returns the frame
+# index of every counted rep
+def rep_frames(counter, angles, active, timestamps):
+    frames = []
+    for i in np.flatnonzero(~np.isnan(angles)):
+        counter.rep_detected = False
+        counter.observe(float(angles[i]), int(active[i]), float(timestamps[i]))
+        if counter.rep_detected:
+            frames.append(int(i))
+    return frames
+
+
+# Combined joint angle per frame of a stored track and the counted reps
+def track_angles(data, exercise_key):
+    counter = RepCounter(exercise_key)
+    if counter.triplets is None:
+        return np.full(len(data["timestamps"]), np.nan), []
+    angles, active = counter.combine(smoothed_track(data))
+    return angles, rep_frames(counter, angles, active, data["timestamps"])
+
+
+# Each rep spans from the most extended frame before it was counted to the
+# most extended frame before the next one, so its window holds one full
+# down-and-up cycle. Form score is taken at the deepest point of the rep.
+def rep_breakdown(angles, timestamps, counted, exercise_key):
+    if not counted:
+        return []
+
+    valid = np.flatnonzero(~np.isnan(angles))
+    bounds = [int(valid[0]), *counted, int(valid[-1]) + 1]
+    peaks = [
+        start + int(np.nanargmax(angles[start:end]))
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+    rows = []
+    for rep, (start, end) in enumerate(zip(peaks[:-1], peaks[1:]), start=1):
+        window = angles[start:end + 1]
+        low, high = float(np.nanmin(window)), float(np.nanmax(window))
+        rows.append({
+            "rep": rep,
+            "time": round(float(timestamps[counted[rep - 1]]), 2),
+            "min_angle": round(low, 1),
+            "max_angle": round(high, 1),
+            "range_of_motion": round(high - low, 1),
+            "tempo": round(float(timestamps[end] - timestamps[start]), 2),
+            "form_score": round(calculate_form_score(exercise_key, low), 1),
+        })
+    return rows
+
+
+# ================= ANGLE CHART =================
+CHART_SIZE = (1000, 320)  # width, height in pixels
+CHART_MARGIN = (50, 15, 15, 30)  # left, top, right, bottom
+CHART_MAX_ANGLE = 180
+CHART_LINE_COLOR = (180, 119, 31)
+CHART_THRESHOLD_COLOR = (80, 80, 200)
+CHART_GRID_COLOR = (225, 225, 225)
+CHART_TEXT_COLOR = (60, 60, 60)
+CHART_PNG_FLAGS = [cv2.IMWRITE_PNG_COMPRESSION, 9]
+
+
+def dashed_line(image, y, x0, x1, color, dash=8):
+    for x in range(x0, x1, dash * 2):
+        cv2.line(image, (x, y), (min(x + dash, x1), y), color, 1, cv2.LINE_AA)
+
+
+# Joint angle over time with the rep thresholds dashed and counted reps
+# marked; gaps where no pose was found are left open
+def render_angle_chart(angles, timestamps, counted, rule):
+    width, height = CHART_SIZE
+    left, top, right, bottom = CHART_MARGIN
+    plot_w, plot_h = width - left - right, height - top - bottom
+    image = np.full((height, width, 3), 255, np.uint8)
+
+    duration = float(timestamps[-1]) if len(timestamps) and timestamps[-1] > 0 else 1.0
+
+    def to_y(angle):
+        return int(round(top + plot_h * (1 - angle / CHART_MAX_ANGLE)))
+
+    def to_x(t):
+        return int(round(left + plot_w * t / duration))
+
+    for angle in range(0, CHART_MAX_ANGLE + 1, 45):
+        y = to_y(angle)
+        cv2.line(image, (left, y), (left + plot_w, y), CHART_GRID_COLOR, 1)
+        cv2.putText(image, str(angle), (8, y + 4), cv2.FONT_HERSHEY_SIMPLEX, 0.4, CHART_TEXT_COLOR, 1, cv2.LINE_AA)
+
+    step = max(1, int(np.ceil(duration / 10)))
+    for second in range(0, int(duration) + 1, step):
+        x = to_x(second)
+        cv2.putText(image, f"{second}s", (x - 8, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, CHART_TEXT_COLOR, 1, cv2.LINE_AA)
+
+    for threshold in (rule["extended"], rule["flexed"]):
+        dashed_line(image, to_y(threshold), left, left + plot_w, CHART_THRESHOLD_COLOR)
+
+    points = np.stack([
+        left + plot_w * np.asarray(timestamps) / duration,
+        top + plot_h * (1 - angles / CHART_MAX_ANGLE),
+    ], axis=-1)
+    valid = ~np.isnan(angles)
+    runs = np.split(np.arange(len(angles)), np.flatnonzero(np.diff(valid)) + 1)
+    lines = [points[run].round().astype(np.int32) for run in runs if valid[run[0]]]
+    cv2.polylines(image, lines, False, CHART_LINE_COLOR, 2, cv2.LINE_AA)
+
+    for i in counted:
+        cv2.circle(image, (to_x(timestamps[i]), to_y(angles[i])), 4, CHART_THRESHOLD_COLOR, -1, cv2.LINE_AA)
+
+    cv2.rectangle(image, (left, top), (left + plot_w, top + plot_h), CHART_TEXT_COLOR, 1)
+    return image
+
+
+# ================= CACHED SESSION ASSETS =================
+# Per-rep rows and the angle chart kept as {base}.reps.json and
+# {base}.png; build() returns (rows, chart image) and only runs the first
+# time, every later report reads the files back
+def cached_assets(base, build):
+    chart_path, reps_path = f"{base}.png", f"{base}.reps.json"
+
+    if os.path.exists(chart_path) and os.path.exists(reps_path):
+        with open(reps_path) as f:
+            return {"rep_breakdown": json.load(f), "angle_chart": chart_path}
+
+    rows, chart = build()
+    _, png = cv2.imencode(".png", chart, CHART_PNG_FLAGS)
+
+    write_atomic(chart_path, png.tobytes())
+    write_atomic(reps_path, json.dumps(rows).encode())
+    return {"rep_breakdown": rows, "angle_chart": chart_path}
+
+
+# Assets of an analysed video that has no stored session, from its
+# landmark track. Raises FileNotFoundError when there is no track.
+def session_report_assets(video_dir, chart_dir, video_id, exercise_key):
+    def build():
+        data = load_track(track_path(video_dir, video_id))
+        timestamps = data["timestamps"]
+        angles, counted = track_angles(data, exercise_key)
+        rows = rep_breakdown(angles, timestamps, counted, exercise_key)
+        return rows, render_angle_chart(angles, timestamps, counted, REP_RULES[exercise_key])
+
+    return cached_assets(os.path.join(chart_dir, f"{video_id}.{exercise_key}"), build)
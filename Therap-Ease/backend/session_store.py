@@ -0,0 +1,293 @@
+import os
+import uuid
+from array import array
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func
+
+from .database import SessionLocal
+from .models import WorkoutSession, Rep, AngleSeries
+from .rep_counter import REP_RULES
+from .session_report import (
+    cached_assets,
+    rep_breakdown,
+    render_angle_chart,
+    session_report_assets,
+)
+
+SERIES_DTYPE = np.dtype("<f4")
+HISTORY_LIMIT = 200  # most sessions one history request returns
+
+
+def pack_series(values):
+    return np.asarray(values, dtype=SERIES_DTYPE).tobytes()
+
+
+def unpack_series(blob):
+    return np.frombuffer(blob, dtype=SERIES_DTYPE)
+
+
+# ================= LIVE RECORDING =================
+# Combined joint angle of every inferred frame of one live exercise, kept
+# in flat arrays and written in one go when the session ends
+class SessionRecording:
+    def __init__(self, exercise_key):
+        self.exercise_key = exercise_key
+        self.started_at = datetime.utcnow()
+        self.timestamps = array("d")
+        self.angles = array("d")
+        self.counted = []  # frame index of each counted rep
+        self.summary = None  # RepCounter.summary() once the exercise ends
+
+    def add(self, t, angle, rep_detected):
+        if rep_detected:
+            self.counted.append(len(self.angles))
+        self.timestamps.append(t)
+        self.angles.append(angle)
+
+
+# ================= WRITES =================
+# One transaction per session: the session row, its reps and the angle
+# series. fields are WorkoutSession columns; returns the session id.
+def save_session(fields, timestamps, angles, counted):
+    rows = rep_breakdown(angles, timestamps, counted, fields["exercise_key"])
+
+    db = SessionLocal()
+    try:
+        if fields.get("video_id"):
+            # Re-uploads of an analysed clip are the same session
+            existing = (
+                db.query(WorkoutSession.id)
+                .filter(
+                    WorkoutSession.video_id == fields["video_id"],
+                    WorkoutSession.exercise_key == fields["exercise_key"],
+                    WorkoutSession.patient_id == fields["patient_id"],
+                )
+                .first()
+            )
+            if existing is not None:
+                return existing.id
+
+        session = WorkoutSession(
+            id=uuid.uuid4().hex,
+            range_of_motion=(
+                float(np.mean([row["range_of_motion"] for row in rows])) if rows else None
+            ),
+            **fields,
+        )
+        db.add(session)
+        db.add_all([
+            Rep(
+                session_id=session.id,
+                number=row["rep"],
+                time=row["time"],
+                min_angle=row["min_angle"],
+                max_angle=row["max_angle"],
+                range_of_motion=row["range_of_motion"],
+                tempo=row["tempo"],
+                form_score=row["form_score"],
+            )
+            for row in rows
+        ])
+        db.add(AngleSeries(
+            session_id=session.id,
+            frames=len(angles),
+            timestamps=pack_series(timestamps),
+            angles=pack_series(angles),
+        ))
+        db.commit()
+        return session.id
+    finally:
+        db.close()
+
+
+# Timestamps are stored relative to the first recorded frame
+def save_recording(recording, patient_id):
+    if not recording.angles:
+        return None
+
+    timestamps = np.frombuffer(recording.timestamps, dtype=np.float64)
+    timestamps = timestamps - timestamps[0]
+    summary = recording.summary
+    return save_session(
+        {
+            "patient_id": patient_id,
+            "exercise_key": recording.exercise_key,
+            "source": "live",
+            "started_at": recording.started_at,
+            "duration": float(timestamps[-1]),
+            "reps": summary["reps"],
+            "avg_time": summary["avg_time"],
+            "form_score": summary["form_score"],
+        },
+        timestamps,
+        np.frombuffer(recording.angles, dtype=np.float64),
+        recording.counted,
+    )
+
+
+# ================= QUERIES =================
+def session_to_dict(session):
+    return {
+        "session_id": session.id,
+        "patient_id": session.patient_id,
+        "patient_name": session.patient_name,
+        "exercise_key": session.exercise_key,
+        "source": session.source,
+        "video_id": session.video_id,
+        "started_at": session.started_at.isoformat(),
+        "duration": session.duration,
+        "reps": session.reps,
+        "assigned_reps": session.assigned_reps,
+        "sets": session.sets,
+        "avg_time": session.avg_time,
+        "form_score": session.form_score,
+        "range_of_motion": session.range_of_motion,
+    }
+
+
+def rep_to_dict(rep):
+    return {
+        "rep": rep.number,
+        "time": rep.time,
+        "min_angle": rep.min_angle,
+        "max_angle": rep.max_angle,
+        "range_of_motion": rep.range_of_motion,
+        "tempo": rep.tempo,
+        "form_score": rep.form_score,
+    }
+
+
+def patient_sessions(db, patient_id, exercise_key=None, since=None, until=None):
+    query = db.query(WorkoutSession).filter(WorkoutSession.patient_id == patient_id)
+    if exercise_key:
+        query = query.filter(WorkoutSession.exercise_key == exercise_key)
+    if since:
+        query = query.filter(WorkoutSession.started_at >= since)
+    if until:
+        query = query.filter(WorkoutSession.started_at < until)
+    return query
+
+
+# Newest first
+def session_history(db, patient_id, exercise_key=None, since=None, until=None, limit=HISTORY_LIMIT):
+    return (
+        patient_sessions(db, patient_id, exercise_key, since, until)
+        .order_by(WorkoutSession.started_at.desc())
+        .limit(min(limit, HISTORY_LIMIT))
+        .all()
+    )
+
+
+# Per day and exercise, oldest first, straight from the session rows
+def session_progress(db, patient_id, exercise_key=None, since=None, until=None):
+    day = func.date(WorkoutSession.started_at)
+    rows = (
+        patient_sessions(db, patient_id, exercise_key, since, until)
+        .with_entities(
+            day,
+            WorkoutSession.exercise_key,
+            func.count(WorkoutSession.id),
+            func.sum(WorkoutSession.reps),
+            func.sum(WorkoutSession.duration),
+            func.avg(WorkoutSession.form_score),
+            func.avg(WorkoutSession.range_of_motion),
+            func.avg(WorkoutSession.avg_time),
+        )
+        .group_by(day, WorkoutSession.exercise_key)
+        .order_by(day)
+        .all()
+    )
+    return [
+        {
+            "date": date,
+            "exercise_key": key,
+            "sessions": sessions,
+            "reps": reps or 0,
+            "duration": duration or 0.0,
+            "form_score": form_score,
+            "range_of_motion": range_of_motion,
+            "avg_time": avg_time,
+        }
+        for date, key, sessions, reps, duration, form_score, range_of_motion, avg_time in rows
+    ]
+
+
+def session_detail(db, session_id, series=False):
+    session = db.get(WorkoutSession, session_id)
+    if session is None:
+        return None
+
+    reps = db.query(Rep).filter(Rep.session_id == session_id).order_by(Rep.number).all()
+    detail = {**session_to_dict(session), "rep_breakdown": [rep_to_dict(rep) for rep in reps]}
+    if series:
+        stored = db.get(AngleSeries, session_id)
+        if stored is not None:
+            angles = unpack_series(stored.angles)
+            detail["series"] = {
+                "timestamps": unpack_series(stored.timestamps).round(3).tolist(),
+                # NaN (no pose) is not valid JSON
+                "angles": [None if np.isnan(a) else round(float(a), 1) for a in angles],
+            }
+    return detail
+
+
+# Report fields of stored sessions, so a report can name a session instead
+# of the client sending every number back
+def stored_report_fields(session_ids):
+    db = SessionLocal()
+    try:
+        sessions = db.query(WorkoutSession).filter(WorkoutSession.id.in_(session_ids)).all()
+    finally:
+        db.close()
+
+    fields = {}
+    for session in sessions:
+        values = {
+            "patient_id": session.patient_id,
+            "patient_name": session.patient_name,
+            "exercise": session.exercise_key,
+            "reps": session.reps,
+            "assigned_reps": session.assigned_reps,
+            "sets": session.sets,
+            "duration": session.duration,
+            "avg_time": session.avg_time,
+            "form_score": session.form_score,
+            "video_id": session.video_id,
+            "exercise_key": session.exercise_key,
+        }
+        fields[session.id] = {key: value for key, value in values.items() if value is not None}
+    return fields
+
+
+# Assets of a stored session, live or video, from its angle series and
+# rep rows; cached per session id, as sessions never change once stored.
+# Raises FileNotFoundError when the session or its series is missing.
+def stored_session_assets(chart_dir, session_id):
+    def build():
+        db = SessionLocal()
+        try:
+            session = db.get(WorkoutSession, session_id)
+            series = db.get(AngleSeries, session_id)
+            reps = db.query(Rep).filter(Rep.session_id == session_id).order_by(Rep.number).all()
+        finally:
+            db.close()
+        if session is None or series is None:
+            raise FileNotFoundError(session_id)
+
+        timestamps = unpack_series(series.timestamps)
+        angles = unpack_series(series.angles)
+        # Rep times are the rounded timestamps of the frames that counted them
+        counted = [int(np.abs(timestamps - rep.time).argmin()) for rep in reps]
+        chart = render_angle_chart(angles, timestamps, counted, REP_RULES[session.exercise_key])
+        return [rep_to_dict(rep) for rep in reps], chart
+
+    return cached_assets(os.path.join(chart_dir, f"session_{session_id}"), build)
+
+
+# source is ("session", session_id) or ("video", video_id, exercise_key)
+def report_assets(video_dir, chart_dir, source):
+    if source[0] == "session":
+        return stored_session_assets(chart_dir, source[1])
+    return session_report_assets(video_dir, chart_dir, source[1], source[2])
@@ -0,0 +1,72 @@
+import math
+import os
+
+import numpy as np
+
+# ================= ONE-EURO SMOOTHING =================
+# Low-pass filter whose cutoff rises with speed: still limbs are smoothed
+# hard, fast movement keeps little lag. Units are normalized image
+# coordinates per second.
+SMOOTHING_ENABLED = os.environ.get("POSE_SMOOTHING", "1") != "0"
+SMOOTH_MIN_CUTOFF = 1.5  # Hz at rest
+SMOOTH_BETA = 5.0        # extra Hz per unit/s of speed
+SMOOTH_D_CUTOFF = 1.0    # Hz for the speed estimate
+SMOOTH_RESET_GAP = 0.5   # seconds without a pose before starting over
+
+
+# cutoff may be a scalar or an array of per-coordinate cutoffs
+def smoothing_factor(dt, cutoff):
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+# Filters a whole (33, 4) landmark array per call; state is two arrays and
+# a timestamp, whatever the session length.
+class OneEuroFilter:
+    def __init__(
+        self,
+        min_cutoff=SMOOTH_MIN_CUTOFF,
+        beta=SMOOTH_BETA,
+        d_cutoff=SMOOTH_D_CUTOFF,
+        reset_gap=SMOOTH_RESET_GAP,
+    ):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset_gap = reset_gap
+        self.reset()
+
+    def reset(self):
+        self.value = None
+        self.speed = None
+        self.t = None
+
+    # landmarks: (33, 4); t: seconds
+    def __call__(self, landmarks, t):
+        dt = t - self.t if self.t is not None else None
+        if dt is None or dt > self.reset_gap:
+            self.value = landmarks.copy()
+            self.speed = np.zeros_like(landmarks)
+            self.t = t
+            return self.value
+        if dt <= 0:
+            # Duplicate or reordered timestamp; keep the current estimate
+            return self.value
+
+        speed = (landmarks - self.value) / dt
+        self.speed += smoothing_factor(dt, self.d_cutoff) * (speed - self.speed)
+
+        cutoff = self.min_cutoff + self.beta * np.abs(self.speed)
+        alpha = smoothing_factor(dt, cutoff).astype(landmarks.dtype)
+        self.value = self.value + alpha * (landmarks - self.value)
+        self.t = t
+        return self.value
+
+
+# Offline pass over a (T, 33, 4) track; NaN rows are left as they are
+def smooth_track(track, timestamps, **kwargs):
+    smoother = OneEuroFilter(**kwargs)
+    smoothed = track.copy()
+    for i in np.flatnonzero(~np.isnan(track[:, 0, 0])):
+        smoothed[i] = smoother(track[i], float(timestamps[i]))
+    return smoothed
@@ -0,0 +1,66 @@
+import os
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# ================= UPLOAD LIMITS =================
+UPLOAD_CHUNK = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", 500)) * 1024 * 1024
+# Room for the multipart boundaries and form fields around the video
+UPLOAD_FORM_OVERHEAD = UPLOAD_CHUNK
+
+
+def upload_too_large():
+    return HTTPException(
+        status_code=413,
+        detail=f"Video exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit",
+    )
+
+
+# FastAPI parses and spools the whole multipart body before a handler
+# runs, so upload routes are guarded here, on the raw ASGI stream.
+# paths maps each guarded path to an optional check (raising
+# HTTPException) run before any of the body is read. A declared
+# Content-Length over the limit is refused unread; a body that runs past
+# it anyway (chunked, or longer than declared) fails as soon as it does.
+class UploadLimit:
+    def __init__(self, app, paths, max_bytes=MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            check = self.paths[scope["path"]]
+            if check is not None:
+                check()
+
+            headers = dict(scope["headers"])
+            if int(headers.get(b"content-length") or 0) > self.max_bytes:
+                raise upload_too_large()
+        except HTTPException as exc:
+            response = JSONResponse(
+                {"detail": exc.detail},
+                status_code=exc.status_code,
+                headers=exc.headers,
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing
+                    raise upload_too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
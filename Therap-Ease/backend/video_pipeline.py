@@ -0,0 +1,446 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import mediapipe as mp
+from fastapi import HTTPException
+
+from .files import atomic_path
+from .landmarks import NUM_LANDMARKS, landmarks_to_array
+from .rep_counter import RepCounter
+from .smoothing import smooth_track, SMOOTHING_ENABLED
+
+mp_pose = mp.solutions.pose
+
+OVERLAY_COLOR = (255, 255, 0)
+
+# Everything that changes the extracted track; part of the cache key
+POSE_PARAMS = {
+    "model_complexity": 1,
+    "min_detection_confidence": 0.5,
+    "min_tracking_confidence": 0.5,
+}
+
+
+# Frames are downscaled so the longest side is at most this many pixels
+# before inference; 0 keeps the full resolution. Landmarks are normalized,
+# so the track and overlay do not depend on it.
+INFER_MAX_SIDE = int(os.environ.get("VIDEO_INFER_MAX_SIDE", 640))
+
+
+# ================= PARALLEL SEGMENTS =================
+SEGMENT_WORKERS = int(os.environ.get("VIDEO_SEGMENT_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_FRAMES = 30 * 60  # shorter clips are not worth the process start-up
+SEGMENT_OVERLAP = 15           # frames decoded before a segment so tracking re-converges
+
+_segment_pool = None
+# Video requests and jobs call segment_pool() from several threads
+_segment_pool_lock = threading.Lock()
+
+
+def segment_pool():
+    global _segment_pool
+    with _segment_pool_lock:
+        if _segment_pool is None:
+            # spawn, not fork: MediaPipe threads do not survive a fork
+            _segment_pool = ProcessPoolExecutor(
+                max_workers=SEGMENT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _segment_pool
+
+
+def shutdown_segment_pool():
+    global _segment_pool
+    with _segment_pool_lock:
+        if _segment_pool is not None:
+            _segment_pool.shutdown(wait=False, cancel_futures=True)
+            _segment_pool = None
+
+
+def track_path(video_dir, video_id):
+    return os.path.join(video_dir, f"{video_id}.landmarks.npz")
+
+
+def probe_video(input_path):
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise HTTPException(status_code=400, detail="Video open failed")
+
+    info = {
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 30,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+    }
+    cap.release()
+    return info
+
+
+# ================= ADAPTIVE SAMPLING =================
+SAMPLE_STRIDE = int(os.environ.get("VIDEO_SAMPLE_STRIDE", 4))  # infer every Nth frame between thresholds
+SAMPLE_MARGIN = 20  # degrees around a threshold that switch back to every frame
+
+
+# Sampled tracks depend on the exercise thresholds, so both go in the cache key
+def track_params(exercise_key, sample_stride=1, params=POSE_PARAMS, max_side=INFER_MAX_SIDE):
+    params = {**params, "infer_max_side": max_side}
+    if sample_stride <= 1:
+        return params
+    return {**params, "sample_stride": sample_stride, "exercise_key": exercise_key}
+
+
+# Decides which frames go through the model. Runs at the base stride and
+# drops to every frame when the pose is lost or the angle is near the one
+# threshold that can change the rep state next (flexed while extended,
+# extended otherwise), so holding a position stays cheap.
+class AdaptiveSampler:
+    def __init__(self, exercise_key, stride=SAMPLE_STRIDE, margin=SAMPLE_MARGIN):
+        self.counter = RepCounter(exercise_key)
+        self.stride = stride
+        self.margin = margin
+        self.next_idx = 0
+
+    def wants(self, idx):
+        return idx >= self.next_idx
+
+    def observe(self, idx, landmarks):
+        step = self.stride
+        if landmarks is None:
+            step = 1
+        elif self.counter.triplets is not None:
+            angle, active = self.counter.combine(landmarks)
+            self.counter.observe(float(angle), int(active), idx)
+
+            rule = self.counter.rule
+            stage = self.counter.state()["stage"]
+            threshold = rule["flexed"] if stage == rule["stages"][0] else rule["extended"]
+            if abs(angle - threshold) < self.margin:
+                step = 1
+        self.next_idx = idx + step
+
+
+# Fills frames the sampler skipped by linear interpolation between the
+# nearest inferred frames that found a pose. Edges stay NaN.
+def interpolate_skipped(track, inferred):
+    known = np.flatnonzero(inferred & ~np.isnan(track[:, 0, 0]))
+    missing = np.flatnonzero(~inferred)
+    if len(known) < 2 or not len(missing):
+        return track
+
+    missing = missing[(missing > known[0]) & (missing < known[-1])]
+    right = np.searchsorted(known, missing)
+    left = known[right - 1]
+    right = known[right]
+    weight = ((missing - left) / (right - left)).astype(np.float32)[:, None, None]
+
+    track = track.copy()
+    track[missing] = track[left] * (1 - weight) + track[right] * weight
+    return track
+
+
+# Decode, resize and colour-convert into the same arrays for every frame of
+# a video instead of allocating three new images per frame
+class FrameBuffers:
+    def __init__(self, max_side=INFER_MAX_SIDE):
+        self.max_side = max_side
+        self.frame = None
+        self.small = None
+        self.rgb = None
+
+    def read(self, cap):
+        ret, frame = cap.read(self.frame)
+        if ret:
+            self.frame = frame
+        return ret
+
+    def to_rgb(self):
+        frame = self.frame
+        if self.rgb is None:
+            h, w = frame.shape[:2]
+            scale = self.max_side / max(h, w) if self.max_side else 1
+            if scale < 1:
+                w, h = int(w * scale), int(h * scale)
+                self.small = np.empty((h, w, 3), np.uint8)
+            self.rgb = np.empty((h, w, 3), np.uint8)
+
+        if self.small is not None:
+            size = self.small.shape[1::-1]
+            frame = cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_LINEAR)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb)
+
+
+# ================= STAGE 1: LANDMARK EXTRACTION =================
+# Long videos are split across worker processes. The overlay video is not
+# drawn here; render_overlay builds it from the stored track on request.
+# progress, when given, is called with the completed fraction (0..1).
+def extract_video(
+    input_path,
+    exercise_key=None,
+    params=POSE_PARAMS,
+    progress=None,
+    sample_stride=1,
+    max_side=INFER_MAX_SIDE,
+):
+    info = probe_video(input_path)
+    if SEGMENT_WORKERS < 2 or info["frame_count"] < PARALLEL_MIN_FRAMES:
+        return extract_landmarks(input_path, exercise_key, params, progress, sample_stride, max_side)
+    return extract_landmarks_parallel(
+        input_path, info, params, exercise_key=exercise_key,
+        sample_stride=sample_stride, max_side=max_side, progress=progress,
+    )
+
+
+# Shared decode/infer loop. Frames before keep_from only warm up the
+# tracker. Skipped frames are grabbed without decoding and returned as NaN
+# rows; callers fill them with interpolate_skipped once the whole track is
+# assembled, so segment edges interpolate across their neighbours.
+def infer_frames(
+    cap,
+    pose,
+    first=0,
+    keep_from=0,
+    end=None,
+    sampler=None,
+    max_side=INFER_MAX_SIDE,
+    progress=None,
+):
+    empty = np.full((NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    buffers = FrameBuffers(max_side)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frames = []
+    inferred = []
+    idx = first
+
+    while end is None or idx < end:
+        # The first kept frame is always inferred so every segment starts
+        # on a known pose
+        infer = sampler is None or idx <= keep_from or sampler.wants(idx)
+        ret = buffers.read(cap) if infer else cap.grab()
+        if not ret:
+            break
+
+        landmarks = None
+        if infer:
+            res = pose.process(buffers.to_rgb())
+            if res.pose_landmarks:
+                landmarks = landmarks_to_array(res.pose_landmarks.landmark)
+            if sampler is not None:
+                sampler.observe(idx, landmarks)
+
+        if idx >= keep_from:
+            frames.append(landmarks if landmarks is not None else empty)
+            inferred.append(infer)
+
+        idx += 1
+        if progress and total and idx % 30 == 0:
+            progress(min(idx / total, 0.99))
+
+    if not frames:
+        return np.empty((0, NUM_LANDMARKS, 4), np.float32), np.empty(0, bool)
+
+    return np.stack(frames), np.asarray(inferred, dtype=bool)
+
+
+# Returns a (T, 33, 4) float32 track with NaN rows where no pose was found,
+# per-frame timestamps in seconds, and which frames were actually inferred.
+def extract_landmarks(
+    input_path,
+    exercise_key=None,
+    params=POSE_PARAMS,
+    progress=None,
+    sample_stride=1,
+    max_side=INFER_MAX_SIDE,
+):
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise HTTPException(status_code=400, detail="Video open failed")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    sampler = None
+    if sample_stride > 1:
+        sampler = AdaptiveSampler(exercise_key, sample_stride)
+
+    with mp_pose.Pose(**params) as pose:
+        track, inferred = infer_frames(
+            cap, pose, sampler=sampler, max_side=max_side, progress=progress
+        )
+
+    cap.release()
+    if sampler is not None:
+        track = interpolate_skipped(track, inferred)
+
+    return {
+        "track": track,
+        "timestamps": np.arange(len(track), dtype=np.float64) / fps,
+        "inferred": inferred,
+        "fps": float(fps),
+        "width": w,
+        "height": h,
+    }
+
+
+def extract_landmarks_parallel(
+    input_path,
+    info,
+    params=POSE_PARAMS,
+    overlap=SEGMENT_OVERLAP,
+    exercise_key=None,
+    sample_stride=1,
+    max_side=INFER_MAX_SIDE,
+    progress=None,
+):
+    bounds = np.linspace(0, info["frame_count"], SEGMENT_WORKERS + 1).astype(int)
+    futures = [
+        segment_pool().submit(
+            extract_segment,
+            input_path,
+            int(start),
+            # CAP_PROP_FRAME_COUNT is an estimate; the last segment reads to EOF
+            int(end) if i < SEGMENT_WORKERS - 1 else None,
+            overlap,
+            params,
+            exercise_key,
+            sample_stride,
+            max_side,
+        )
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))
+    ]
+    parts = []
+    for future in futures:
+        parts.append(future.result())
+        if progress:
+            progress(len(parts) / len(futures) * 0.99)
+
+    track = np.concatenate([part[0] for part in parts])
+    inferred = np.concatenate([part[1] for part in parts])
+    if sample_stride > 1:
+        track = interpolate_skipped(track, inferred)
+    return {
+        "track": track,
+        "timestamps": np.arange(len(track), dtype=np.float64) / info["fps"],
+        "inferred": inferred,
+        "fps": float(info["fps"]),
+        "width": info["width"],
+        "height": info["height"],
+    }
+
+
+# Runs in a worker process. Decoding starts `overlap` frames early so the
+# tracker has re-locked onto the patient by the first frame we keep.
+def extract_segment(
+    input_path,
+    start,
+    end,
+    overlap,
+    params,
+    exercise_key=None,
+    sample_stride=1,
+    max_side=INFER_MAX_SIDE,
+):
+    cap = cv2.VideoCapture(input_path)
+    warm_start = max(0, start - overlap)
+    if warm_start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warm_start)
+
+    sampler = None
+    if sample_stride > 1:
+        sampler = AdaptiveSampler(exercise_key, sample_stride)
+
+    with mp_pose.Pose(**params) as pose:
+        result = infer_frames(cap, pose, warm_start, start, end, sampler, max_side)
+
+    cap.release()
+    return result
+
+
+# Draws the active limb of a stored track onto a copy of the source video.
+# Writes to a temporary file first so a half-written video is never served.
+def render_overlay(input_path, output_path, data, exercise_key):
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise HTTPException(status_code=404, detail="Source video not found")
+
+    with atomic_path(output_path, suffix=".mp4") as tmp_path:
+        out = cv2.VideoWriter(
+            tmp_path,
+            cv2.VideoWriter_fourcc(*"mp4v"),
+            data["fps"],
+            (data["width"], data["height"]),
+        )
+        counter = RepCounter(exercise_key)
+        track = smoothed_track(data)
+        idx = 0
+
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if idx < len(track) and not np.isnan(track[idx, 0, 0]):
+                draw_overlay(frame, track[idx], counter)
+            out.write(frame)
+            idx += 1
+
+        cap.release()
+        out.release()
+
+
+def draw_overlay(frame, landmarks, counter):
+    h, w = frame.shape[:2]
+    # Active side only depends on this frame's visibility, not rep state
+    if counter.triplets is None:
+        return
+    _, active = counter.combine(landmarks)
+    if active < 0:
+        return
+
+    points = [
+        (int(landmarks[idx, 0] * w), int(landmarks[idx, 1] * h))
+        for idx in counter.triplets[int(active)]
+    ]
+    cv2.line(frame, points[0], points[1], OVERLAY_COLOR, 3)
+    cv2.line(frame, points[1], points[2], OVERLAY_COLOR, 3)
+    for point in points:
+        cv2.circle(frame, point, 6, OVERLAY_COLOR, -1)
+
+
+# path may be a filename or an open binary file
+def save_track(path, data):
+    np.savez(path, **data)
+
+
+def load_track(path):
+    with np.load(path) as npz:
+        data = {key: npz[key] for key in npz.files}
+    for key, value in data.items():
+        if value.ndim == 0:
+            data[key] = value.item()
+    return data
+
+
+# ================= STAGE 2: ANALYSIS =================
+# Stored and cached tracks stay raw; smoothing is applied on every read
+def smoothed_track(data):
+    if not SMOOTHING_ENABLED:
+        return data["track"]
+    return smooth_track(data["track"], data["timestamps"])
+
+
+def analyze_track(data, exercise_key, overrides=None):
+    counter = RepCounter(exercise_key, overrides)
+    stats = counter.run(smoothed_track(data), data["timestamps"])
+
+    frame_count = len(data["timestamps"])
+    inferred = data.get("inferred")
+    return {
+        **stats,
+        "duration": frame_count / data["fps"] if frame_count else 0.0,
+        "frames": frame_count,
+        "frames_inferred": int(inferred.sum()) if inferred is not None else frame_count,
+    }
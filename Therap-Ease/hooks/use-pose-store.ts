@@ -1,6 +1,6 @@
 import { useRef } from "react";
 import { runOnJS, SharedValue, useSharedValue } from "react-native-reanimated";
-import { processPose } from "../backend/pose/poseEngine";
+import { fromServerState, processPose, ServerRepState } from "../backend/pose/poseEngine";
 
 /* ---------------- TYPES ---------------- */
 
@@ -13,6 +13,7 @@ type PoseKeypoint = {
 
 type PoseFrame = {
   keypoints: PoseKeypoint[];
+  reps?: ServerRepState;
 };
 
 type OnRepCallback = () => void;
@@ -24,7 +25,7 @@ export function usePoseStore(
   onRep: OnRepCallback,
   options?: { preventRepRef?: { current: boolean } }
 ): {
-  processFrame: (pose: PoseFrame) => void;
+  processFrame: (pose: PoseFrame, seq?: number) => void;
   angleSV: SharedValue<number>;
   keypointsSV: SharedValue<PoseKeypoint[]>;
   activeSideSV: SharedValue<"left" | "right" | null>;
@@ -33,6 +34,11 @@ export function usePoseStore(
   const preventRepRef = options?.preventRepRef;
   const stageRef = useRef<"up" | "down" | "-">("-");
   const lastRepTs = useRef<number>(0);
+  // Server rep count already turned into onRep calls
+  const serverRepsRef = useRef<number>(0);
+  // Newest request sequence number applied; requests overlap, so older
+  // responses can arrive after newer ones
+  const lastSeqRef = useRef<number>(0);
 
   const angleSV = useSharedValue<number>(0);
   const keypointsSV = useSharedValue<PoseKeypoint[]>([]);
@@ -61,8 +67,17 @@ export function usePoseStore(
     return score; // 0..1
   };
 
-  const processFrame = (pose: PoseFrame) => {
-    const res = processPose(exerciseKey, pose, stageRef.current) as any;
+  const processFrame = (pose: PoseFrame, seq?: number) => {
+    if (seq !== undefined) {
+      if (seq <= lastSeqRef.current) {
+        return;
+      }
+      lastSeqRef.current = seq;
+    }
+
+    const res = pose.reps
+      ? fromServerState(pose.reps)
+      : processPose(exerciseKey, pose, stageRef.current);
 
     stageRef.current = res.stage;
     angleSV.value = res.angle;
@@ -70,12 +85,33 @@ export function usePoseStore(
     activeSideSV.value = res.activeSide ?? null;
 
     // compute and set last form score per frame
-    if (res.angle && res.angle > 0) {
+    if (pose.reps) {
+      lastFormScoreRef.current = pose.reps.form_score;
+    } else if (res.angle && res.angle > 0) {
       lastFormScoreRef.current = computeFormScore(exerciseKey, res.angle);
     } else {
       lastFormScoreRef.current = null;
     }
 
+    if (pose.reps) {
+      // The server owns the count: fire once per rep it counted since the
+      // last response we saw, so a lost response does not lose its rep
+      const total = pose.reps.reps;
+      const missed = total - serverRepsRef.current;
+      serverRepsRef.current = total;
+      // Responses are applied in request order, so a lower count means
+      // the server started a fresh counter
+      if (missed <= 0 || preventRepRef?.current) {
+        return;
+      }
+
+      lastRepTs.current = Date.now();
+      for (let i = 0; i < missed; i++) {
+        runOnJS(onRep)();
+      }
+      return;
+    }
+
     if (res.repDetected) {
       // Don't call onRep if a higher-level flow has requested rep prevention
       if (preventRepRef?.current) {